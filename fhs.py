@@ -90,11 +90,16 @@ initializing this module.
 
 # Imports. {{{
 import os
+import select
 import sys
-import shutil
-import argparse
-import tempfile
-import atexit
+import stat
+import struct
+import time
+import collections
+import collections.abc
+import functools
+import mmap
+import threading
 # }}}
 
 # Globals. {{{
@@ -104,28 +109,522 @@ initialized = False
 is_system = False
 ## Flag that is set during init() if the application set the game parameter to init().
 is_game = False
+## Flag that is set during init() if the application set the indexed parameter to init().
+is_indexed = False
 ## Default program name; can be overridden from functions that use it.
 pname = os.getenv('PACKAGE_NAME', os.path.basename(sys.argv[0]))
+# HOME and the XDG_* variables are computed when they are first used.  These
+# are the functions that compute them.
+_path_defaults = {}
+
+def _path(name): # {{{
+	'''Get HOME or an XDG_* variable, computing it on first use.
+	A value that was assigned to the module attribute is used as it is.
+	'''
+	try:
+		return globals()[name]
+	except KeyError:
+		value = globals()[name] = _path_defaults[name]()
+		return value
+# }}}
+
+def __getattr__(name): # {{{
+	if name in _path_defaults:
+		return _path(name)
+	raise AttributeError('module %r has no attribute %r' % (__name__, name))
+# }}}
+
 ## Current user's home directory.
-HOME = os.path.expanduser('~')
+_path_defaults['HOME'] = lambda: os.path.expanduser('~')
 # Internal variables.
 _tempfiles = []
 _options = {}
 _option_order = []
+# Short option names in _options, mapped to the long names.
+_shorts = {}
 _module_info = {}
 _module_config = {}
 _module_values = {}
 _module_present = {}
 _base = os.path.abspath(os.path.dirname(sys.argv[0]))
 _atinit = []
+# Number of hooks with each name, and whether any of them was named explicitly.
+_atinit_names = {}
+# }}}
+
+# Path resolution. {{{
+# Resolved lookups, per category.  The values are (result, stamps), where
+# stamps is a tuple of (directory, mtime) pairs that must be unchanged for the
+# result to be used.
+_resolved = {'config': {}, 'data': {}}
+# Directory listings for indexed mode.  Keys are directory names, values are
+# None if the directory does not exist, (st_dev, {name: DirEntry}) otherwise.
+_listings = {}
+# Negative lookup cache: keys are (category, ...) tuples, values are the time
+# at which the entry expires.  The order is least recently used first.
+_misses = collections.OrderedDict()
+_miss_ttl = 0
+_miss_size = 1024
+# Existing search directories, keyed by (category, named, packagename,
+# is_system, is_game).
+_search_dirs = {}
+# Lookups loaded from a manifest, keyed by (category, ...) like _misses.
+_frozen = {}
+# Trace records, or None if tracing is disabled.
+_trace_records = None
+
+class _LookupState(threading.local): # {{{
+	'''State of the lookup that is running on a thread.
+	Lookups may run on several threads, such as parallel atinit() hooks,
+	so every thread has its own.
+	'''
+	# Number of filesystem calls made by the current or most recent lookup.
+	syscalls = 0
+	# Trace record of the call that is currently running.
+	trace = None
+# }}}
+_lookup = _LookupState()
+# Lock for the caches above; lookups may run on several threads, such as the
+# config watcher.
+_cache_lock = threading.RLock()
+
+def _locked(func): # {{{
+	'''Decorator for functions that use the lookup caches.'''
+	@functools.wraps(func)
+	def wrapper(*args, **kwargs):
+		with _cache_lock:
+			return func(*args, **kwargs)
+	return wrapper
+# }}}
+
+def _quiet(): # {{{
+	'''Check if lookups on this thread are left out of counting and tracing.
+	This is true for the thread of watch_config(), so that it does not
+	disturb lookup_syscalls() and the trace of the program.
+	'''
+	return _watcher is not None and threading.current_thread() is _watcher[0]
+# }}}
+
+def _begin_lookup(): # {{{
+	if not _quiet():
+		_lookup.syscalls = 0
+# }}}
+
+def lookup_syscalls(): # {{{
+	'''Report the cost of the most recent lookup.
+	This counts the stat() and open() calls that were made by the most
+	recent call to read_config(), read_data(), read_cache(), read_spool(),
+	read_runtime(), read_config_many() or read_data_many() on the calling
+	thread.  It is meant for testing the efficiency of lookups.
+	@return The number of filesystem calls.
+	'''
+	return _lookup.syscalls
+# }}}
+
+def _stat(path): # {{{
+	'''Stat a path, counting the call.
+	@return The stat result, or None if the path does not exist.
+	'''
+	if _quiet():
+		record = None
+	else:
+		_lookup.syscalls += 1
+		record = _lookup.trace
+	if record is not None:
+		start = time.perf_counter()
+	try:
+		st = os.stat(path or os.path.curdir)
+	except OSError:
+		st = None
+	if record is not None:
+		record['probes'].append(('stat', path, st is not None, time.perf_counter() - start))
+	return st
+# }}}
+
+def _listing(d, listings = None): # {{{
+	'''Get the contents of a directory for indexed mode.
+	Every directory is scanned only once.  A directory whose parent has
+	already been scanned and does not contain it is not scanned at all.
+	@param listings: The dict to store the listings in.  Defaults to the
+		global index.
+	@return None if the directory does not exist, (st_dev, entries)
+		otherwise, where entries is a dict of os.DirEntry objects.
+	'''
+	if listings is None:
+		listings = _listings
+	d = d or os.path.curdir
+	if d in listings:
+		return listings[d]
+	parent, base = os.path.split(d)
+	if parent in listings and parent != d:
+		if listings[parent] is None or base not in listings[parent][1] or not listings[parent][1][base].is_dir():
+			listings[d] = None
+			return None
+	if _quiet():
+		record = None
+	else:
+		_lookup.syscalls += 2
+		record = _lookup.trace
+	if record is not None:
+		start = time.perf_counter()
+	try:
+		st = os.stat(d)
+		with os.scandir(d) as it:
+			listings[d] = (st.st_dev, {entry.name: entry for entry in it})
+	except OSError:
+		listings[d] = None
+	if record is not None:
+		record['probes'].append(('scandir', d, listings[d] is not None, time.perf_counter() - start))
+	return listings[d]
+# }}}
+
+def _forget_listing(d): # {{{
+	'''Remove the listing of a directory and its subdirectories from the index.'''
+	d = d or os.path.curdir
+	prefix = os.path.join(d, '')
+	for key in [key for key in _listings if key == d or key.startswith(prefix)]:
+		del _listings[key]
+# }}}
+
+def _probe(path, dir, listings = None): # {{{
+	'''Check a candidate path using a single stat() call.
+	In indexed mode, or if listings is given, the path is looked up in the
+	listing of its directory instead; this normally costs no calls at all.
+	@param dir: If True, the path must be a directory; otherwise it must
+		not be one.
+	@param listings: Directory listings to use, see _listing().
+	@return The identity of the file as (st_dev, st_ino), or None if it
+		does not exist or has the wrong type.
+	'''
+	if listings is None and is_indexed:
+		listings = _listings
+	if listings is not None:
+		listing = _listing(os.path.dirname(path), listings)
+		entry = None if listing is None else listing[1].get(os.path.basename(path))
+		if _lookup.trace is not None and not _quiet():
+			_lookup.trace['probes'].append(('index', path, entry is not None, 0.))
+		if entry is None:
+			return None
+		if not entry.is_symlink():
+			if entry.is_dir(follow_symlinks = False) != dir:
+				return None
+			return (listing[0], entry.inode())
+		if not _quiet():
+			_lookup.syscalls += 1
+		try:
+			st = entry.stat()
+		except OSError:
+			return None
+	else:
+		st = _stat(path)
+	if st is None or stat.S_ISDIR(st.st_mode) != dir:
+		return None
+	return (st.st_dev, st.st_ino)
+# }}}
+
+def _mtime(path): # {{{
+	st = _stat(path)
+	return None if st is None else st.st_mtime_ns
+# }}}
+
+def _open(path, text, mapped = False): # {{{
+	if _quiet():
+		record = None
+	else:
+		_lookup.syscalls += 1
+		record = _lookup.trace
+	if record is not None:
+		start = time.perf_counter()
+	try:
+		if not mapped:
+			return open(path, 'r' if text else 'rb')
+		with open(path, 'rb') as f:
+			if os.fstat(f.fileno()).st_size == 0:
+				# Empty files cannot be mapped.
+				return memoryview(b'')
+			return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+	finally:
+		if record is not None:
+			record['probes'].append(('mmap' if mapped else 'open', path, True, time.perf_counter() - start))
+# }}}
+
+def negative_cache(ttl, size = 1024): # {{{
+	'''Configure the cache of failed lookups.
+	Lookups by read_config(), read_data(), read_cache() and read_spool()
+	that find nothing are remembered for ttl seconds.  Until then, the same
+	lookup returns its empty result without touching the filesystem.  The
+	corresponding write_*() function forgets all misses of its file type
+	immediately.  The cache is disabled by default.
+	@param ttl: Time in seconds to remember a miss.  0 disables the cache.
+	@param size: Maximum number of misses to remember.  When it is full,
+		the least recently used entry is dropped.
+	@return None.
+	'''
+	global _miss_ttl, _miss_size
+	_miss_ttl = ttl
+	_miss_size = size
+	if ttl <= 0:
+		_misses.clear()
+	while len(_misses) > size:
+		_misses.popitem(last = False)
+# }}}
+
+@_locked
+def _known_miss(key): # {{{
+	if key not in _misses:
+		return False
+	if _misses[key] < time.monotonic():
+		del _misses[key]
+		return False
+	_misses.move_to_end(key)
+	return True
+# }}}
+
+@_locked
+def _record_miss(key): # {{{
+	if _miss_ttl <= 0:
+		return
+	_misses[key] = time.monotonic() + _miss_ttl
+	_misses.move_to_end(key)
+	while len(_misses) > _miss_size:
+		_misses.popitem(last = False)
+# }}}
+
+@_locked
+def _resolve(category, candidates, name, dir, multiple, packagename): # {{{
+	'''Find the target of a read_*() call.
+	Every candidate is checked with a single stat() call; duplicates are
+	detected by device and inode number.
+
+	The result is cached.  A cached result is used as long as the
+	modification time of the directory containing it is unchanged, so a
+	cached lookup costs one stat() call per returned path.  Files which are
+	created elsewhere in the search path by other processes are not
+	noticed; call invalidate() for that.  Misses are cached only if
+	negative_cache() is used to enable that.
+	@param category: Cache category; the name of the file type.
+	@param candidates: Function returning the list of paths to try.
+	@return The path, or a list of paths if multiple is True.  If nothing
+		is found, None or an empty list.
+	'''
+	cache = _resolved[category]
+	key = (name, packagename, dir, multiple, is_system, is_game)
+	if (category,) + key in _frozen:
+		return _frozen[(category,) + key]
+	if key in cache:
+		result, stamps = cache[key]
+		changed = [d for d, m in stamps if _mtime(d) != m]
+		if len(changed) == 0:
+			return result
+		del cache[key]
+		# The listings of changed directories are out of date as well.
+		for d in changed:
+			_forget_listing(d)
+	if _known_miss((category,) + key):
+		return [] if multiple else None
+	seen = set()
+	found = []
+	for t in candidates(name, dir, packagename):
+		identity = _probe(t, dir)
+		if identity is not None and identity not in seen:
+			found.append(t)
+			if not multiple:
+				break
+			seen.add(identity)
+	if len(found) > 0:
+		dirs = [os.path.dirname(t) for t in found]
+		cache[key] = (found if multiple else found[0], tuple((d, _mtime(d)) for d in dirs))
+	else:
+		_record_miss((category,) + key)
+	if multiple:
+		return found
+	return found[0] if len(found) > 0 else None
+# }}}
+
+@_locked
+def _resolve_many(dirs, names, dir): # {{{
+	'''Find several files in one pass over the search path.
+	Every directory is listed once for all names, so directories that do
+	not exist cost one call in total instead of one call per name.
+	@param dirs: The directories to search, in order.
+	@param names: The names to find.
+	@return A dict with the found path for every name, or None.
+	'''
+	listings = _listings if is_indexed else {}
+	ret = {}
+	pending = list(dict.fromkeys(names))
+	for d in dirs:
+		if len(pending) == 0:
+			break
+		if _listing(d, listings) is None:
+			continue
+		remaining = []
+		for name in pending:
+			t = os.path.join(d, name)
+			if _probe(t, dir, listings) is None:
+				remaining.append(name)
+			else:
+				ret[name] = t
+		pending = remaining
+	for name in pending:
+		ret[name] = None
+	return ret
+# }}}
+
+@_locked
+def _search_path(category, dirs, named, packagename): # {{{
+	'''Get the existing directories of a search path.
+	The list is computed once: directories that do not exist are left out
+	and duplicates are removed by device and inode number.  It is
+	recomputed after refresh() is called, or after a write_*() call for the
+	file type, because the caller may create the directory of the name
+	that it returned.
+	@param category: The name of the file type.
+	@param dirs: Function returning the full search path.
+	@return The list of directories.
+	'''
+	key = (category, named, packagename, is_system, is_game)
+	if key not in _search_dirs:
+		seen = set()
+		ret = []
+		for d in dirs(named, packagename):
+			st = _stat(d)
+			if st is None or not stat.S_ISDIR(st.st_mode) or (st.st_dev, st.st_ino) in seen:
+				continue
+			seen.add((st.st_dev, st.st_ino))
+			ret.append(d)
+		_search_dirs[key] = ret
+	return _search_dirs[key]
+# }}}
+
+@_locked
+def _forget_dirs(category): # {{{
+	for key in [k for k in _search_dirs if k[0] == category]:
+		del _search_dirs[key]
+	_invalidate(category)
+# }}}
+
+@_locked
+def _invalidate(category): # {{{
+	if category in _resolved:
+		_resolved[category].clear()
+		_listings.clear()
+	for key in [k for k in _misses if k[0] == category]:
+		del _misses[key]
+	for key in [k for k in _frozen if k[0] == category]:
+		del _frozen[key]
+# }}}
+
+def invalidate(): # {{{
+	'''Forget all cached path lookups.
+	This should be called when files may have been added to the search path
+	by other processes, or after changing the working directory.  In
+	indexed mode, this also discards all directory listings.  Files that
+	are written through this module are handled automatically.
+	@return None.
+	'''
+	for category in ('config', 'data', 'cache', 'spool'):
+		_invalidate(category)
+# }}}
+
+@_locked
+def refresh(): # {{{
+	'''Recompute the list of existing search directories.
+	This should be called when directories may have been created by other
+	processes, for example when a package was installed while the program
+	is running.  It also calls invalidate().
+	@return None.
+	'''
+	_search_dirs.clear()
+	invalidate()
+# }}}
+# }}}
+
+# Lookup tracing. {{{
+def trace(enable = True): # {{{
+	'''Enable or disable tracing of path lookups.
+	While tracing is enabled, every call to a read_*() or write_*()
+	function is recorded, with every filesystem operation it made, the
+	time spent, and the result.  Use trace_report() to show a summary.
+	This is also enabled by passing --fhs-trace on the commandline.
+	@param enable: If True (the default), start tracing.  If False, stop
+		tracing and discard the records.
+	@return None.
+	'''
+	global _trace_records
+	if not enable:
+		_trace_records = None
+	elif _trace_records is None:
+		_trace_records = []
+# }}}
+
+def _traced(func): # {{{
+	'''Decorator for recording calls to read_*() and write_*() functions.'''
+	@functools.wraps(func)
+	def wrapper(*args, **kwargs):
+		if _trace_records is None or _quiet():
+			return func(*args, **kwargs)
+		name = kwargs.get('name', args[0] if len(args) > 0 else None)
+		if not isinstance(name, str):
+			name = None
+		record = {'function': func.__name__, 'name': name, 'probes': [], 'seconds': 0., 'result': None}
+		_trace_records.append(record)
+		outer = _lookup.trace
+		_lookup.trace = record
+		start = time.perf_counter()
+		try:
+			ret = func(*args, **kwargs)
+		finally:
+			record['seconds'] = time.perf_counter() - start
+			_lookup.trace = outer
+		if isinstance(ret, (str, list)) or ret is None:
+			record['result'] = ret
+		elif isinstance(ret, dict):
+			record['result'] = '%d of %d found' % (sum(x is not None for x in ret.values()), len(ret))
+		else:
+			record['result'] = getattr(ret, 'filename', None) or getattr(ret, 'name', None)
+		return ret
+	return wrapper
+# }}}
+
+def trace_report(file = None, count = 10): # {{{
+	'''Print a summary of the recorded lookups.
+	This shows the slowest calls, the names that needed the most filesystem
+	operations, and the total time spent in the filesystem.
+	@param file: File to write the report to.  Defaults to sys.stderr.
+	@param count: Number of entries to show in each list.
+	@return None.
+	'''
+	if file is None:
+		file = sys.stderr
+	if _trace_records is None:
+		print('fhs trace: tracing is not enabled', file = file)
+		return
+	def describe(record):
+		return '%s(%s)' % (record['function'], '' if record['name'] is None else repr(record['name']))
+	operations = sum(len(r['probes']) for r in _trace_records)
+	fs_time = sum(p[3] for r in _trace_records for p in r['probes'])
+	total = sum(r['seconds'] for r in _trace_records)
+	print('fhs trace: %d calls, %d filesystem operations, %.3f ms in the filesystem, %.3f ms total' % (len(_trace_records), operations, fs_time * 1e3, total * 1e3), file = file)
+	print('Slowest calls:', file = file)
+	for record in sorted(_trace_records, key = lambda r: r['seconds'], reverse = True)[:count]:
+		print('\t%.3f ms\t%s -> %s (%d operations)' % (record['seconds'] * 1e3, describe(record), record['result'], len(record['probes'])), file = file)
+	probed = {}
+	for record in _trace_records:
+		probed[describe(record)] = probed.get(describe(record), 0) + len(record['probes'])
+	print('Most probed names:', file = file)
+	for name in sorted(probed, key = lambda n: probed[n], reverse = True)[:count]:
+		print('\t%d\t%s' % (probed[name], name), file = file)
+# }}}
 # }}}
 
 # Configuration files. {{{
 ## XDG home directory.
-XDG_CONFIG_HOME = os.getenv('XDG_CONFIG_HOME', os.path.join(HOME, '.config'))
+_path_defaults['XDG_CONFIG_HOME'] = lambda: os.getenv('XDG_CONFIG_HOME', os.path.join(_path('HOME'), '.config'))
 ## XDG config directory search path.
-XDG_CONFIG_DIRS = tuple([XDG_CONFIG_HOME] + os.getenv('XDG_CONFIG_DIRS', '/etc/xdg').split(':'))
+_path_defaults['XDG_CONFIG_DIRS'] = lambda: tuple([_path('XDG_CONFIG_HOME')] + os.getenv('XDG_CONFIG_DIRS', '/etc/xdg').split(':'))
 
+@_traced
 def write_config(name = None, text = True, dir = False, opened = True, packagename = None): # {{{
 	'''Open a config file for writing.  The file is not truncated if it exists.
 	@param name: Name of the config file.
@@ -136,6 +635,7 @@ def write_config(name = None, text = True, dir = False, opened = True, packagena
 	@return The opened file, or the name of the file or directory.
 	'''
 	assert initialized is not False
+	_forget_dirs('config')
 	if name is None:
 		if dir:
 			filename = packagename or pname
@@ -149,49 +649,30 @@ def write_config(name = None, text = True, dir = False, opened = True, packagena
 		else:
 			d = os.path.join('/etc/xdg', pname)
 	else:
-		d = XDG_CONFIG_HOME
+		d = _path('XDG_CONFIG_HOME')
 	target = os.path.join(d, filename)
 	if dir:
-		if opened and not os.path.exists(target):
+		if opened and _stat(target) is None:
 			os.makedirs(target)
 		return target
 	else:
 		d = os.path.dirname(target)
-		if opened and not os.path.exists(d):
+		if opened and _stat(d) is None:
 			os.makedirs(d)
 		return open(target, 'w+' if text else 'w+b') if opened else target
 # }}}
 
-def read_config(name = None, text = True, dir = False, multiple = False, opened = True, packagename = None): # {{{
-	'''Open a config file for reading.  The paramers should be identical to what was used to create the file with write_config().
-	@param name: Name of the config file.
-	@param text: Open as a text file if True (the default).
-	@param dir: Return a directory name if True, a file or filename if False (the default).
-	@param opened: Open the file if True (the default), report the name if False.
-	@param packagename: Override the packagename.
-	@return The opened file, or the name of the file or directory.
+def _config_dirs(named, packagename): # {{{
+	'''List the directories that read_config() searches, in order.
+	@param named: True if a name was passed to read_config().  The user
+		directory includes the package name only in that case.
 	'''
-	assert initialized is not False
-	if name is None:
-		if dir:
-			filename = packagename or pname
-		else:
-			filename = (packagename or pname) + os.extsep + 'cfg'
-	else:
-		filename = name
-	seen = set()
-	target = []
+	ret = []
 	if not is_system:
-		t = os.path.join(XDG_CONFIG_HOME, filename if name is None else os.path.join(packagename or pname, name))
-		if os.path.realpath(t) not in seen and os.path.exists(t) and (dir if os.path.isdir(t) else not dir):
-			r = t if dir or not opened else open(t, 'r' if text else 'rb')
-			if not multiple:
-				return r
-			seen.add(os.path.realpath(t))
-			target.append(r)
+		ret.append(os.path.join(_path('XDG_CONFIG_HOME'), packagename or pname) if named else _path('XDG_CONFIG_HOME'))
 	dirs = ['/etc/xdg', '/usr/local/etc/xdg']
 	if not is_system:
-		for d in XDG_CONFIG_DIRS:
+		for d in _path('XDG_CONFIG_DIRS'):
 			dirs.insert(0, d)
 	if packagename and packagename != pname:
 		dirs = [os.path.join(x, pname, packagename) for x in dirs] + [os.path.join(x, packagename) for x in dirs]
@@ -201,18 +682,67 @@ def read_config(name = None, text = True, dir = False, multiple = False, opened
 		dirs.insert(0, packagename or pname)
 		dirs.insert(0, os.path.curdir)
 		dirs.insert(0, _base)
-	for d in dirs:
-		t = os.path.join(d, filename)
-		if os.path.realpath(t) not in seen and os.path.exists(t) and (dir if os.path.isdir(t) else not dir):
-			r = t if dir or not opened else open(t, 'r' if text else 'rb')
-			if not multiple:
-				return r
-			seen.add(os.path.realpath(t))
-			target.append(r)
-	if multiple:
-		return target
+	ret.extend(dirs)
+	return ret
+# }}}
+
+def _config_candidates(name, dir, packagename): # {{{
+	if name is None:
+		if dir:
+			filename = packagename or pname
+		else:
+			filename = (packagename or pname) + os.extsep + 'cfg'
 	else:
-		return None
+		filename = name
+	return [os.path.join(d, filename) for d in _search_path('config', _config_dirs, name is not None, packagename)]
+# }}}
+
+@_traced
+def read_config(name = None, text = True, dir = False, multiple = False, opened = True, packagename = None, mmap = False): # {{{
+	'''Open a config file for reading.  The paramers should be identical to what was used to create the file with write_config().
+	@param name: Name of the config file.
+	@param text: Open as a text file if True (the default).
+	@param dir: Return a directory name if True, a file or filename if False (the default).
+	@param opened: Open the file if True (the default), report the name if False.
+	@param packagename: Override the packagename.
+	@param mmap: If True, return a read-only mmap object of the file
+		instead of a file object.  The text parameter is ignored.  An
+		empty file cannot be mapped; for it an empty memoryview is
+		returned.  The caller should close the map when done with it.
+	@return The opened file, or the name of the file or directory.
+	'''
+	assert initialized is not False
+	_begin_lookup()
+	result = _resolve('config', _config_candidates, name, dir, multiple, packagename)
+	if dir or not opened:
+		return list(result) if multiple else result
+	if multiple:
+		return [_open(t, text, mmap) for t in result]
+	return None if result is None else _open(result, text, mmap)
+# }}}
+
+@_traced
+def read_config_many(names, text = True, dir = False, opened = True, packagename = None): # {{{
+	'''Open several config files for reading.
+	This is equivalent to calling read_config() for every name, but the
+	search path is walked only once.
+	@param names: Iterable of names of config files.
+	@param text: Open as text files if True (the default).
+	@param dir: Return directory names if True, files or filenames if False (the default).
+	@param opened: Open the files if True (the default), report the names if False.
+	@param packagename: Override the packagename.
+	@return A dict with the opened file, or the name of the file or
+		directory, for every name.  Names that are not found map to
+		None.
+	'''
+	assert initialized is not False
+	_begin_lookup()
+	ret = _resolve_many(_search_path('config', _config_dirs, True, packagename), names, dir)
+	if opened and not dir:
+		for name in ret:
+			if ret[name] is not None:
+				ret[name] = _open(ret[name], text)
+	return ret
 # }}}
 
 def remove_config(name = None, dir = False, packagename = None): # {{{
@@ -222,6 +752,7 @@ def remove_config(name = None, dir = False, packagename = None): # {{{
 	@param packagename: Override the packagename.
 	@return None.
 	'''
+	import shutil
 	assert initialized is not False
 	if dir:
 		shutil.rmtree(read_config(name, False, True, False, False, packagename), ignore_errors = False)
@@ -230,31 +761,32 @@ def remove_config(name = None, dir = False, packagename = None): # {{{
 # }}}
 
 # Config file helper functions. {{{
+# Compiled patterns for _protect(), keyed by the extra characters.
+_protect_patterns = {}
+# Escapes that _unprotect() handles: the \<hex>; that _protect() writes, and
+# characters that are not allowed.
+_unprotect_pattern = None
+
 def _protect(data, extra = ''): # {{{
-	ret = ''
-	extra += '\\'
-	for x in str(data):
-		o = ord(x)
-		if o < 32 or o >= 127 or x in extra:
-			ret += '\\%x;' % o
-		else:
-			ret += x
-	return ret
+	if extra not in _protect_patterns:
+		import re
+		_protect_patterns[extra] = re.compile('[^\x20-\x7e]|[%s]' % re.escape(extra + '\\'))
+	return _protect_patterns[extra].sub(lambda m: '\\%x;' % ord(m.group()), str(data))
+# }}}
+
+def _unprotect_match(match): # {{{
+	if match.group(1) is not None:
+		return chr(int(match.group(1), 16))
+	# newlines can happen; only the printable range is valid.
+	return ''
 # }}}
 
 def _unprotect(data): # {{{
-	ret = ''
-	while len(data) > 0:
-		if data[0] == '%':
-			l = data.index(';')
-			ret += chr(int(data[1:l], 16))
-			data = data[l + 1:]
-		else:
-			if 32 <= ord(data[0]) < 127:
-				# newlines can happen; only this range is valid.
-				ret += data[0]
-			data = data[1:]
-	return ret
+	global _unprotect_pattern
+	if _unprotect_pattern is None:
+		import re
+		_unprotect_pattern = re.compile(r'\\([0-9a-fA-F]+);|[^\x20-\x7e]')
+	return _unprotect_pattern.sub(_unprotect_match, data)
 # }}}
 
 def decode_value(value, argtype): # {{{
@@ -341,7 +873,261 @@ def version_text(): # {{{
 				print('\t\tPlease send feedback and bug reports for %s to %s' % (mod, _module_info[mod]['contact']), file = sys.stderr)
 # }}}
 
-def load_config(filename, values = None, present = None, options = None): # {{{
+def _read_config_lines(f, filename, replay = False): # {{{
+	'''Split a config file into keys and raw values.
+	@param f: Iterable of lines.
+	@param filename: Name of the file, for warnings.
+	@param replay: If True, the file is a journal and the last value of a
+		key is used.  Otherwise, the first one is used.
+	@return A dict of key: (False, value), where the value is still
+		protected.
+	'''
+	ret = {}
+	for cfg in f:
+		if cfg.strip() == '' or cfg.strip().startswith('#'):
+			continue
+		if '=' not in cfg:
+			print('invalid line in config file %s: %s' % (filename, cfg), file = sys.stderr)
+			continue
+		key, value = cfg.split('=', 1)
+		key = _unprotect(key)
+		if replay or key not in ret:
+			ret[key] = (False, value)
+	return ret
+# }}}
+
+def _journal_lines(f): # {{{
+	'''Read the complete records from a journal.
+	The last line is left out if it has no newline, because it may have
+	been cut off by a crash while it was written.
+	'''
+	return f.read().split('\n')[:-1]
+# }}}
+
+def _decode_config_value(key, value, options): # {{{
+	'''Decode a raw value from a config file.  Raises ValueError if the value is invalid.'''
+	if options is None or key not in options:
+		return _unprotect(value)
+	if options[key]['multiple']:
+		return [decode_value(_unprotect(v), options[key]['argtype']) for v in value.split(',')]
+	return decode_value(_unprotect(value), options[key]['argtype'])
+# }}}
+
+def _decode_config_default(key, value, options, default): # {{{
+	'''Decode a raw config value, or return the default if it is invalid.'''
+	try:
+		return _decode_config_value(key, value, options)
+	except ValueError:
+		print('Warning: error loading value for %s; ignoring' % key, file = sys.stderr)
+		return default
+# }}}
+
+def _compile_config(entries, options): # {{{
+	'''Decode all values that can be stored in a snapshot.
+	Values of options with a custom argtype are left raw, because their
+	type cannot be stored.  They are decoded again when the snapshot is
+	used.  So are values that fail to decode, so the warning is repeated.
+	'''
+	ret = {}
+	for key, (decoded, value) in entries.items():
+		if not decoded and key in options and options[key]['argtype'] in (str, int, float, bool):
+			try:
+				ret[key] = (True, _decode_config_value(key, value, options))
+				continue
+			except ValueError:
+				pass
+		ret[key] = (decoded, value)
+	return ret
+# }}}
+
+# Config snapshots. {{{
+# A snapshot is a cache of a parsed config file.  It starts with the magic
+# string and the validation key, followed by the entries.  Every value is
+# stored as a type byte followed by its data.
+_SNAPSHOT_MAGIC = b'fhs-snapshot-1\n'
+# Parsed configurations, keyed by (filename, layered).  Values are (key,
+# entries), see _config_entries().
+_config_views = {}
+
+def _snapshot_encode(value, out): # {{{
+	if value is None or isinstance(value, bool):
+		out.append({None: b'N', True: b'T', False: b'F'}[value])
+	elif type(value) is int:
+		data = str(value).encode('ascii')
+		out.append(b'i' + struct.pack('<I', len(data)) + data)
+	elif type(value) is float:
+		out.append(b'f' + struct.pack('<d', value))
+	elif type(value) is str:
+		data = value.encode('utf-8', 'surrogatepass')
+		out.append(b's' + struct.pack('<I', len(data)) + data)
+	elif type(value) is list:
+		out.append(b'l' + struct.pack('<I', len(value)))
+		for item in value:
+			_snapshot_encode(item, out)
+	else:
+		raise ValueError('value cannot be stored in snapshot')
+# }}}
+
+def _snapshot_decode(data, pos): # {{{
+	'''Decode one value.  Raises ValueError or struct.error on corrupt data.
+	@return The value and the position after it.
+	'''
+	tag = data[pos:pos + 1]
+	pos += 1
+	if tag in (b'N', b'T', b'F'):
+		return {b'N': None, b'T': True, b'F': False}[tag], pos
+	if tag == b'f':
+		return struct.unpack_from('<d', data, pos)[0], pos + 8
+	if tag == b'l':
+		length = struct.unpack_from('<I', data, pos)[0]
+		pos += 4
+		ret = []
+		for i in range(length):
+			item, pos = _snapshot_decode(data, pos)
+			ret.append(item)
+		return ret, pos
+	if tag not in (b'i', b's'):
+		raise ValueError('invalid snapshot')
+	length = struct.unpack_from('<I', data, pos)[0]
+	pos += 4
+	if pos + length > len(data):
+		raise ValueError('truncated snapshot')
+	value = data[pos:pos + length]
+	if tag == b'i':
+		return int(value.decode('ascii')), pos + length
+	return value.decode('utf-8', 'surrogatepass'), pos + length
+# }}}
+
+def _snapshot_dump(key, entries): # {{{
+	out = [_SNAPSHOT_MAGIC]
+	_snapshot_encode(key, out)
+	_snapshot_encode([[k, decoded, value] for k, (decoded, value) in entries.items()], out)
+	return b''.join(out)
+# }}}
+
+def _snapshot_load(data, key): # {{{
+	'''Parse a snapshot.
+	@return The entries, or None if the snapshot is invalid or does not
+		match the key.
+	'''
+	if not data.startswith(_SNAPSHOT_MAGIC):
+		return None
+	try:
+		stored, pos = _snapshot_decode(data, len(_SNAPSHOT_MAGIC))
+		if stored != key:
+			return None
+		entries, pos = _snapshot_decode(data, pos)
+	except (ValueError, struct.error):
+		return None
+	if pos != len(data):
+		return None
+	return {k: (decoded, value) for k, decoded, value in entries}
+# }}}
+
+def _registry_hash(options): # {{{
+	'''Compute a hash of the option names and types.'''
+	import hashlib
+	h = hashlib.sha1()
+	for name in sorted(options):
+		argtype = options[name]['argtype']
+		h.update(repr((name, options[name]['multiple'], getattr(argtype, '__module__', None), getattr(argtype, '__qualname__', None))).encode('utf-8'))
+	return h.hexdigest()
+# }}}
+
+def _snapshot_name(filename, layered): # {{{
+	import hashlib
+	return 'config-' + hashlib.sha1(repr((filename, layered)).encode('utf-8', 'surrogatepass')).hexdigest() + os.extsep + 'snapshot'
+# }}}
+
+def _read_snapshot(name, key): # {{{
+	f = read_cache(name, text = False)
+	if f is None:
+		return None
+	with f:
+		return _snapshot_load(f.read(), key)
+# }}}
+
+def _write_snapshot(name, key, entries): # {{{
+	try:
+		data = _snapshot_dump(key, entries)
+		with write_cache(name, text = False) as f:
+			f.truncate()
+			f.write(data)
+	except (OSError, ValueError):
+		# Not being able to store a snapshot is not a problem.
+		pass
+# }}}
+# }}}
+
+def _config_entries(filename, options, layered, snapshot): # {{{
+	'''Get the parsed contents of a configuration.
+	The result is kept in memory and, if snapshot is True, in a snapshot in
+	the cache directory.  Both are used as long as the name, size and
+	modification time of every file, and the registered options, are
+	unchanged.  Otherwise, the files are parsed again.
+	@param filename: Name of the file, without the ".ini" extension.
+	@param options: Registered options, or None to keep all values raw.
+	@param layered: If True, merge all files with this name in the search
+		path; files that are found first take precedence.  If False,
+		only use the first file.
+	The journal that update_config() writes, if any, takes precedence over
+	all files.
+	@param snapshot: If True, use a snapshot in the cache directory.
+	@return The entries, see _compile_config(), or None if no file exists.
+	'''
+	name = filename + os.extsep + 'ini'
+	paths = read_config(name, multiple = True, opened = False) if layered else [read_config(name, opened = False)]
+	journal = read_config(filename + os.extsep + 'journal', opened = False)
+	layers = []
+	for path, replay in [(journal, True)] + [(path, False) for path in paths]:
+		st = None if path is None else _stat(path)
+		if st is not None:
+			layers.append([path, replay, os.path.abspath(path), st.st_size, st.st_mtime_ns])
+	if len(layers) == 0:
+		return None
+	key = [[layer[1:] for layer in layers], None if options is None else _registry_hash(options)]
+	view = _config_views.get((filename, layered))
+	if view is not None and view[0] == key:
+		return view[1]
+	entries = None
+	if snapshot and options is not None:
+		entries = _read_snapshot(_snapshot_name(filename, layered), key)
+	if entries is None:
+		entries = {}
+		for path, replay in (layer[:2] for layer in layers):
+			with open(path) as f:
+				for k, v in _read_config_lines(_journal_lines(f) if replay else f, path, replay).items():
+					if k not in entries:
+						entries[k] = v
+		if options is not None:
+			entries = _compile_config(entries, options)
+		if snapshot and options is not None:
+			_write_snapshot(_snapshot_name(filename, layered), key, entries)
+	_config_views[(filename, layered)] = (key, entries)
+	return entries
+# }}}
+
+def load_config(filename, values = None, present = None, options = None, snapshot = False, layered = False, lazy = False): # {{{
+	'''Load a configuration file.
+	@param filename: Name of the file, without the ".ini" extension.
+	@param values: Dict to store the values in.  If given, keys that are
+		not in it are rejected.
+	@param present: Dict of keys that were already set and must not be
+		changed.  Keys that are loaded are added to it.
+	@param options: Registered options; used for decoding the values.  If
+		None, the values are returned as strings.
+	@param snapshot: If True and options is given, use a compiled snapshot
+		of the file from the cache directory when it is up to date.
+	@param layered: If True, merge all files with this name in the config
+		search path, such as the user's file, the files in
+		XDG_CONFIG_DIRS and /etc/xdg.  Values in files that read_config()
+		finds first take precedence.  If False (the default), only the
+		first file is used.  Records in the journal that was written
+		by update_config() are applied on top in either case.
+	@param lazy: If True, values that need a custom argtype are not
+		converted, but stored as deferred values for a _LazyConfig.
+	@return The values dict.
+	'''
 	if present is None:
 		present = {}
 	if values is None:
@@ -349,35 +1135,89 @@ def load_config(filename, values = None, present = None, options = None): # {{{
 		values = {}
 	else:
 		new_values = False
-	config = read_config(filename + os.extsep + 'ini')
-	if config is None:
+	entries = _config_entries(filename, options, layered, snapshot)
+	if entries is None:
 		return {}
-	for cfg in config:
-		if cfg.strip() == '' or cfg.strip().startswith('#'):
-			continue
-		if '=' not in cfg:
-			print('invalid line in config file %s: %s' % (filename, cfg), file = sys.stderr)
-		key, value = cfg.split('=', 1)
-		key = _unprotect(key)
+	for key, (decoded, value) in entries.items():
 		if not new_values and key not in values:
 			print('invalid key %s in config file' % key, file = sys.stderr)
 			continue
 		if key in present and present[key]:
 			continue
-		try:
-			if options is not None and options[key]['multiple']:
-				values[key] = [decode_value(_unprotect(v), options[key]['argtype']) for v in value.split(',')]
-			else:
-				values[key] = _unprotect(value) if options is None else decode_value(_unprotect(value), options[key]['argtype'])
-		except ValueError:
-			print('Warning: error loading value for %s; ignoring' % key, file = sys.stderr)
-			continue
-		if present is not None:
-			present[key] = True
+		if not decoded and lazy:
+			value = _Deferred(_decode_config_default, key, value, options, values.get(key))
+		elif not decoded:
+			try:
+				value = _decode_config_value(key, value, options)
+			except ValueError:
+				print('Warning: error loading value for %s; ignoring' % key, file = sys.stderr)
+				continue
+		elif isinstance(value, list):
+			# Don't share the list with the cached entries.
+			value = list(value)
+		values[key] = value
+		present[key] = True
 	return values
 # }}}
 
-def save_config(config, name = None, packagename = None):	# {{{
+def _config_line(key, value): # {{{
+	'''Encode a key and value as a line of a config file.'''
+	if isinstance(value, list):
+		value = ','.join(_protect(encode_value(x), ',') for x in value)
+	else:
+		value = _protect(encode_value(value))
+	return '%s=%s\n' % (_protect(key, '='), value)
+# }}}
+
+# Delayed saves, keyed by name.  Values are (config, atomic, fsync).
+_pending_saves = {}
+_save_lock = threading.Lock()
+_save_timer = None
+_save_registered = False
+
+def _write_atomic(target, data, fsync): # {{{
+	'''Replace a file with new contents, so that it is never half written.
+	The data is written to a temporary file in the same directory, which is
+	then renamed over the target.  If the target is a symbolic link, the
+	file that it points to is replaced, and the link is kept.
+	@param target: The file to write.
+	@param data: The new contents, as str or bytes.
+	@param fsync: If True, make sure the data and the rename are on disk
+		before returning.
+	'''
+	import tempfile
+	target = os.path.realpath(target)
+	d = os.path.dirname(target)
+	fd, tmp = tempfile.mkstemp(dir = d, prefix = '.' + os.path.basename(target) + '-')
+	try:
+		# mkstemp() uses mode 0600; give the file the mode of the file it
+		# replaces, or the mode that open() would use for a new file.
+		st = _stat(target)
+		if st is not None:
+			mode = stat.S_IMODE(st.st_mode)
+		else:
+			umask = os.umask(0)
+			os.umask(umask)
+			mode = 0o666 & ~umask
+		os.fchmod(fd, mode)
+		with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w') as f:
+			f.write(data)
+			f.flush()
+			if fsync:
+				os.fsync(f.fileno())
+		os.replace(tmp, target)
+	except:
+		os.unlink(tmp)
+		raise
+	if fsync:
+		dirfd = os.open(d, os.O_RDONLY)
+		try:
+			os.fsync(dirfd)
+		finally:
+			os.close(dirfd)
+# }}}
+
+def save_config(config, name = None, packagename = None, atomic = False, fsync = True, delay = None):	# {{{
 	'''Save a dict as a configuration file.
 	Write the config dict to a file in the configuration directory.  The
 	file is named <packagename>.ini, unless overridden.
@@ -386,25 +1226,287 @@ def save_config(config, name = None, packagename = None):	# {{{
 		this.
 	@param packagename: Override for the name of the package, to determine
 		the directory to save to.
+	@param atomic: If True, write to a temporary file and rename it over
+		the target, so that a crash never leaves a partial file.
+	@param fsync: If True (the default) and atomic is True, wait until the
+		data is on disk.  If False, the rename is durable only after the
+		system flushes it.
+	@param delay: If not None, don't save now, but in a background thread
+		once no delayed save has been requested for this many seconds.
+		Every delayed save restarts the wait with its own delay, and
+		replaces the pending data for the same file, so rapid updates
+		are written once.  Pending saves are written at exit, or by
+		calling flush_config().
+	A journal that was written by update_config() for this file is removed,
+	because the saved values replace it.
 	'''
+	import atexit
+	global _save_timer, _save_registered
 	assert initialized is not False
+	if delay is not None:
+		with _save_lock:
+			_pending_saves[name] = (dict(config), atomic, fsync)
+			if not _save_registered:
+				atexit.register(flush_config)
+				_save_registered = True
+			if _save_timer is not None:
+				_save_timer.cancel()
+			_save_timer = threading.Timer(delay, flush_config)
+			_save_timer.daemon = True
+			_save_timer.start()
+		return
 	if name is None:
 		filename = 'commandline' + os.extsep + 'ini'
 	else:
 		filename = name + os.extsep + 'ini'
 	keys = list(config.keys())
 	keys.sort()
-	with write_config(filename) as f:
-		for key in keys:
-			if isinstance(config[key], list):
-				value = ','.join(_protect(encode_value(x), ',') for x in config[key])
-			else:
-				value = _protect(encode_value(config[key]))
-			f.write('%s=%s\n' % (_protect(key, '='), value))
+	lines = [_config_line(key, config[key]) for key in keys]
+	if not atomic:
+		with write_config(filename) as f:
+			f.write(''.join(lines))
+	else:
+		target = write_config(filename, opened = False)
+		d = os.path.dirname(target)
+		if _stat(d) is None:
+			os.makedirs(d)
+			_forget_dirs('config')
+		_write_atomic(target, ''.join(lines), fsync)
+	journal = write_config(('commandline' if name is None else name) + os.extsep + 'journal', opened = False)
+	fd = _lock_journal(journal, False)
+	if fd is not None:
+		os.unlink(journal)
+		os.close(fd)
+# }}}
+
+def flush_config(): # {{{
+	'''Write all configuration files that were saved with a delay.
+	This is called automatically when the delay expires and at exit.
+	@return None.
+	'''
+	global _save_timer
+	with _save_lock:
+		if _save_timer is not None:
+			_save_timer.cancel()
+			_save_timer = None
+		pending = dict(_pending_saves)
+		_pending_saves.clear()
+	for name, (config, atomic, fsync) in pending.items():
+		save_config(config, name, atomic = atomic, fsync = fsync)
+# }}}
+
+def _lock_journal(path, create): # {{{
+	'''Open a journal and take an exclusive lock on it.
+	If the journal was removed or replaced while waiting for the lock, the
+	new one is opened instead.
+	@param create: If True, create the journal if it does not exist.
+	@return The file descriptor, or None if the journal does not exist and
+		create is False.  Closing it releases the lock.
+	'''
+	import fcntl
+	while True:
+		try:
+			fd = os.open(path, os.O_RDWR | os.O_APPEND | (os.O_CREAT if create else 0), 0o666)
+		except FileNotFoundError:
+			return None
+		fcntl.flock(fd, fcntl.LOCK_EX)
+		st = os.fstat(fd)
+		try:
+			current = os.stat(path)
+		except FileNotFoundError:
+			current = None
+		if current is not None and (current.st_dev, current.st_ino) == (st.st_dev, st.st_ino):
+			return fd
+		os.close(fd)
+# }}}
+
+def update_config(changes, name = None, packagename = None, threshold = 65536): # {{{
+	'''Store changes to a configuration file in its journal.
+	Instead of rewriting the whole file, the changed values are appended to
+	a journal next to it, named <name>.journal.  load_config() applies the
+	journal on top of the configuration files.  When the journal grows
+	beyond the threshold, compact_config() is called to fold it into the
+	file.
+	@param changes: dict of changed values.
+	@param name: The name of the file, without ".ini".  Defaults to
+		"commandline".
+	@param packagename: Override for the name of the package.  As with
+		save_config(), this is currently not used.
+	@param threshold: Journal size in bytes above which it is compacted.
+		None means never.
+	@return None.
+	'''
+	assert initialized is not False
+	if name is None:
+		name = 'commandline'
+	target = write_config(name + os.extsep + 'journal', opened = False)
+	d = os.path.dirname(target)
+	if _stat(d) is None:
+		os.makedirs(d)
+		_forget_dirs('config')
+	data = ''.join(_config_line(key, changes[key]) for key in changes).encode('utf-8')
+	# Write all records at once, so concurrent writers don't mix them.
+	fd = _lock_journal(target, True)
+	try:
+		while len(data) > 0:
+			data = data[os.write(fd, data):]
+		size = os.fstat(fd).st_size
+	finally:
+		os.close(fd)
+	if threshold is not None and size > threshold:
+		compact_config(name)
+# }}}
+
+def compact_config(name = None, packagename = None, fsync = True): # {{{
+	'''Fold the journal of a configuration file into the file.
+	The user's file is rewritten atomically with the values from the
+	journal applied, and the journal is removed.  If the file that
+	load_config() uses is not the user's file, for example a file in
+	XDG_CONFIG_DIRS, its values are copied into the new file, because that
+	file hides it from then on.  The journal is locked while this happens;
+	update_config() waits for the lock, so no records are lost.
+	@param name: The name of the file, without ".ini".  Defaults to
+		"commandline".
+	@param packagename: Override for the name of the package.  As with
+		save_config(), this is currently not used.
+	@param fsync: If True, wait until the new file is on disk before
+		removing the journal.
+	@return None.
+	'''
+	assert initialized is not False
+	if name is None:
+		name = 'commandline'
+	journal = write_config(name + os.extsep + 'journal', opened = False)
+	fd = _lock_journal(journal, False)
+	if fd is None:
+		return
+	try:
+		with open(fd, closefd = False) as f:
+			entries = _read_config_lines(_journal_lines(f), journal, True)
+		source = read_config(name + os.extsep + 'ini', opened = False)
+		if source is not None:
+			with open(source) as f:
+				for key, value in _read_config_lines(f, source).items():
+					entries.setdefault(key, value)
+		# This also forgets the lookup of source, which target may hide.
+		target = write_config(name + os.extsep + 'ini', opened = False)
+		_write_atomic(target, ''.join('%s=%s\n' % (_protect(key, '='), entries[key][1].rstrip('\n')) for key in sorted(entries)), fsync)
+		os.unlink(journal)
+	finally:
+		# This releases the lock.
+		os.close(fd)
+# }}}
+# }}}
+
+# Lazy configuration. {{{
+class _Deferred: # {{{
+	'''A value that is computed by calling func(*args) when it is needed.'''
+	__slots__ = ('func', 'args')
+	def __init__(self, func, *args):
+		self.func = func
+		self.args = args
+# }}}
+
+class _LazyConfig(collections.abc.MutableMapping): # {{{
+	'''Configuration mapping that decodes values when they are first used.
+	This is returned by init(), get_config() and module_get_config() if
+	init() was called with lazy = True.  Values are stored as they were
+	found on the commandline or in the config file, and are converted with
+	their argtype when they are first accessed.  The result is then kept.
+	Errors in converting a value are raised at that time.
+	'''
+	def __init__(self, data = ()):
+		self._data = dict(data)
+		self._pending = set(key for key in self._data if self._deferred(self._data[key]))
+	@staticmethod
+	def _deferred(value):
+		return isinstance(value, _Deferred) or (isinstance(value, list) and any(isinstance(x, _Deferred) for x in value))
+	@staticmethod
+	def _realize(value):
+		if isinstance(value, _Deferred):
+			return value.func(*value.args)
+		if isinstance(value, list):
+			return [x.func(*x.args) if isinstance(x, _Deferred) else x for x in value]
+		return value
+	def __getitem__(self, key):
+		value = self._data[key]
+		if key in self._pending:
+			value = self._realize(value)
+			self._data[key] = value
+			self._pending.discard(key)
+		return value
+	def __setitem__(self, key, value):
+		self._data[key] = value
+		if self._deferred(value):
+			self._pending.add(key)
+		else:
+			self._pending.discard(key)
+	def __delitem__(self, key):
+		del self._data[key]
+		self._pending.discard(key)
+	def __iter__(self):
+		return iter(self._data)
+	def __len__(self):
+		return len(self._data)
+	def __repr__(self):
+		return repr(dict(self))
+	def copy(self):
+		'''Return a plain dict with all values decoded.'''
+		return dict(self)
+	def _extract(self, keys):
+		'''Move entries to a new object without decoding them.
+		@param keys: dict of new key: old key.
+		'''
+		ret = _LazyConfig()
+		for new, old in keys.items():
+			ret[new] = self._data.pop(old)
+			self._pending.discard(old)
+		return ret
 # }}}
 # }}}
 
 # Commandline argument handling. {{{
+class _Option: # {{{
+	'''Specification of a registered option.
+	For compatibility, the fields can also be used as dict items, and the
+	object supports the read-only dict methods, so dict(spec) works.
+	'''
+	__slots__ = ('help', 'short', 'multiple', 'optional', 'default', 'noarg', 'argtype', 'module')
+	def __init__(self, help, short, multiple, optional, default, noarg, argtype, module):
+		self.help = help
+		self.short = short
+		self.multiple = multiple
+		self.optional = optional
+		self.default = default
+		self.noarg = noarg
+		self.argtype = argtype
+		self.module = module
+	def __getitem__(self, key):
+		if key not in self.__slots__:
+			raise KeyError(key)
+		return getattr(self, key)
+	def __setitem__(self, key, value):
+		if key not in self.__slots__:
+			raise KeyError(key)
+		setattr(self, key, value)
+	def __contains__(self, key):
+		return key in self.__slots__
+	def __iter__(self):
+		return iter(self.__slots__)
+	def __len__(self):
+		return len(self.__slots__)
+	def get(self, key, default = None):
+		return getattr(self, key) if key in self.__slots__ else default
+	def keys(self):
+		return list(self.__slots__)
+	def values(self):
+		return [getattr(self, key) for key in self.__slots__]
+	def items(self):
+		return [(key, getattr(self, key)) for key in self.__slots__]
+	def __repr__(self):
+		return repr({key: getattr(self, key) for key in self.__slots__})
+# }}}
+
 def option(name, help, short = None, multiple = False, optional = False, default = None, noarg = None, argtype = None, module = None, options = None, option_order = None): # {{{
 	'''Register commandline argument.
 	@param name: Name of the option argument. Should not include the "--" prefix.
@@ -433,7 +1535,8 @@ def option(name, help, short = None, multiple = False, optional = False, default
 	if not isinstance(name, str) or len(name) == 0 or name.startswith('-'):
 		raise ValueError('argument must not start with "-": %s' % name)
 	if short is not None:
-		if any(options[x]['short'] == short for x in options):
+		# Other option tables are small, so only _options is indexed.
+		if short in _shorts if options is _options else any(options[x]['short'] == short for x in options):
 			raise ValueError('duplicate short option %s defined' % short)
 		if len(short) != 1:
 			raise ValueError('length of short option %s for %s must be 1' % (short, name))
@@ -458,12 +1561,115 @@ def option(name, help, short = None, multiple = False, optional = False, default
 					raise ValueError('noarg value %s for %s changes when saving to config file' % (str(noarg), name))
 			except:
 				raise ValueError('noarg value %s for %s cannot be restored from config file' % (str(noarg), name))
-	options[name] = {'help': help, 'short': short, 'multiple': multiple, 'optional': optional, 'default': default, 'noarg': noarg, 'argtype': argtype, 'module': module}
+	options[name] = _Option(help, short, multiple, optional, default, noarg, argtype, module)
+	if short is not None and options is _options:
+		_shorts[short] = name
 	option_order.append(name)
 	return options[name]
 # }}}
 
-def parse_args(argv = None, options = None, extra = False): # {{{
+# Prefix tries of option names, keyed by registry hash.
+_option_tries = {}
+
+def _build_trie(names): # {{{
+	'''Build a prefix trie of option names.
+	Every node is a list [completion, exact, children].  Completion is the
+	only name that starts with the prefix of the node, or False if there
+	are several.  Exact is the name that is equal to the prefix, or None.
+	Children maps the next character to the next node.
+	'''
+	root = [False, None, {}]
+	for name in names:
+		node = root
+		for c in name:
+			child = node[2].get(c)
+			if child is None:
+				child = node[2][c] = [name, None, {}]
+			elif child[0] != name:
+				child[0] = False
+			node = child
+		node[1] = name
+	return root
+# }}}
+
+def _option_trie(options): # {{{
+	'''Get the prefix trie for a set of options.
+	The trie is kept in the user's cache directory, so it is only built once
+	for every set of registered options.  The user's directory is used,
+	because this is needed before --system is parsed.
+	'''
+	import json
+	key = _registry_hash(options)
+	if key in _option_tries:
+		return _option_tries[key]
+	target = os.path.join(_path('XDG_CACHE_HOME'), pname, 'options-' + key + os.extsep + 'json')
+	try:
+		with open(target) as f:
+			trie = json.load(f)
+	except (OSError, ValueError):
+		trie = _build_trie(options)
+		try:
+			d = os.path.dirname(target)
+			if _stat(d) is None:
+				os.makedirs(d)
+			_write_atomic(target, json.dumps(trie, separators = (',', ':')), False)
+		except OSError:
+			pass
+	_option_tries[key] = trie
+	return trie
+# }}}
+
+def _complete_option(trie, prefix): # {{{
+	'''Find the option that a long option name is an abbreviation of.
+	@return The full name, None if no option starts with prefix, or False
+		if more than one does.
+	'''
+	node = trie
+	for c in prefix:
+		node = node[2].get(c)
+		if node is None:
+			return None
+	return node[1] or node[0]
+# }}}
+
+def _response_file(path): # {{{
+	'''Open a response file and return an iterator over its arguments.
+	Raises OSError if the file cannot be opened.
+	'''
+	f = open(path)
+	def lines():
+		with f:
+			for line in f:
+				line = line.rstrip('\n')
+				if line != '':
+					yield line
+	return lines()
+# }}}
+
+def parse_args(argv = None, options = None, extra = False, lazy = False, inplace = True, abbreviations = False, response_files = False): # {{{
+	'''Parse commandline arguments.
+	The arguments are scanned once from left to right.
+	@param argv: The arguments, including the program name.  Defaults to
+		sys.argv.
+	@param options: Registered options.  Defaults to all options that were
+		registered with option().
+	@param extra: If True, also return a dict of which options were given.
+	@param lazy: If True, option arguments are stored as deferred values
+		for a _LazyConfig instead of being converted.
+	@param inplace: If True (the default), remove the parsed options from
+		argv, leaving the program name and the positional arguments.  If
+		False, argv is not changed and the remaining arguments are
+		returned as an extra list.
+	@param abbreviations: If True, long options may be abbreviated to any
+		prefix that matches only one option.
+	@param response_files: If True, an argument of the form @path is
+		replaced by the contents of the file, one argument per line.
+		Empty lines are skipped.  The file is read while it is parsed,
+		so it may contain more arguments than fit on a commandline.
+		Response files may contain @path arguments themselves.
+	@return The values dict, followed by the present dict if extra is True,
+		followed by the remaining arguments if inplace is False.
+	'''
 	if argv is None:
 		argv = sys.argv
 	if options is None:
@@ -471,65 +1677,49 @@ def parse_args(argv = None, options = None, extra = False): # {{{
 	shorts = {options[name]['short']: name for name in options} 
 	values = {name: [] if options[name]['multiple'] else options[name]['default'] for name in options}
 	present = {name: False for name in options}
-	pos = 1
-	while pos < len(argv):
-		current = argv[pos]
-		nextarg = argv[pos + 1] if pos + 1 < len(argv) else None
-		if current == '--':
-			argv.pop(pos)
-			break
-		if len(current) < 2 or not current.startswith('-'):
-			pos += 1
-			continue
-		if current.startswith('--'):
-			# This is a long option.
-			if '=' in current:
-				optname, arg = current.split('=', 1)
-			else:
-				optname, arg = current, None
-			optname = optname[2:]
-			if optname not in options:
-				print('Warning: ignoring unrecognized option %s' % optname)
-				argv.pop(pos)
+	remaining = argv[:1]
+	# Stack of argument sources; response files are pushed on top.
+	sources = [iter(argv[1:])]
+	def next_arg():
+		while len(sources) > 0:
+			arg = next(sources[-1], None)
+			if arg is not None:
+				return arg
+			sources.pop()
+		return None
+	while len(sources) > 0:
+		source = sources[-1]
+		for current in source:
+			if current == '--':
+				while len(sources) > 0:
+					remaining.extend(sources.pop())
+				break
+			if response_files and len(current) > 1 and current.startswith('@'):
+				try:
+					sources.append(_response_file(current[1:]))
+					break
+				except OSError as err:
+					print('Warning: unable to read response file %s: %s' % (current[1:], err), file = sys.stderr)
+			if len(current) < 2 or not current.startswith('-'):
+				remaining.append(current)
 				continue
-			opt = options[optname]
-			argtype = opt['argtype']
-			if argtype is bool:
-				# This option takes no argument.
-				value = opt['noarg']
-			elif opt['optional']:
-				# This option takes an optional argument.
-				if arg is not None:
-					value = opt['argtype'](arg)
+			if current.startswith('--'):
+				# This is a long option.
+				if '=' in current:
+					optname, arg = current.split('=', 1)
 				else:
-					value = opt['noarg']
-			else:
-				# This option requires an argument.
-				if arg is not None:
-					value = opt['argtype'](arg)
-				else:
-					argv.pop(pos)
-					if pos >= len(argv):
-						print('Warning: option %s requires an argument' % optname, file = sys.stderr)
+					optname, arg = current, None
+				optname = optname[2:]
+				if optname not in options and abbreviations:
+					full = _complete_option(_option_trie(options), optname)
+					if full is False:
+						print('Warning: ignoring ambiguous option %s' % optname, file = sys.stderr)
 						continue
-					value = opt['argtype'](argv[pos])
-			if opt['multiple']:
-				values[optname].append(value)
-			else:
-				if present[optname]:
-					print('Warning: option %s must only be passed once' % optname, file = sys.stderr)
-				values[optname] = value
-			present[optname] = True
-		else:
-			# This is a short options argument.
-			optpos = 1
-			while optpos < len(current):
-				o = current[optpos]
-				optpos += 1
-				if o not in shorts:
-					print('Warning: short option %s is not recognized' % o, file = sys.stderr)
+					if full is not None:
+						optname = full
+				if optname not in options:
+					print('Warning: ignoring unrecognized option %s' % optname)
 					continue
-				optname = shorts[o]
 				opt = options[optname]
 				argtype = opt['argtype']
 				if argtype is bool:
@@ -537,37 +1727,221 @@ def parse_args(argv = None, options = None, extra = False): # {{{
 					value = opt['noarg']
 				elif opt['optional']:
 					# This option takes an optional argument.
-					if optpos < len(current):
-						value = opt['argtype'](current[optpos:])
+					if arg is not None:
+						value = _Deferred(opt['argtype'], arg) if lazy else opt['argtype'](arg)
 					else:
 						value = opt['noarg']
-					optpos = len(current)
 				else:
 					# This option requires an argument.
-					if optpos < len(current):
-						value = opt['argtype'](current[optpos:])
+					if arg is not None:
+						value = _Deferred(opt['argtype'], arg) if lazy else opt['argtype'](arg)
 					else:
-						argv.pop(pos)
-						if pos >= len(argv):
-							print('Warning: option %s (%s) requires an argument' % (o, optname), file = sys.stderr)
+						arg = next_arg()
+						if arg is None:
+							print('Warning: option %s requires an argument' % optname, file = sys.stderr)
 							continue
-						value = opt['argtype'](argv[pos])
-					optpos = len(current)
+						value = _Deferred(opt['argtype'], arg) if lazy else opt['argtype'](arg)
 				if opt['multiple']:
 					values[optname].append(value)
 				else:
 					if present[optname]:
-						print('Warning: option %s (%s) must only be passed once' % (o, optname), file = sys.stderr)
+						print('Warning: option %s must only be passed once' % optname, file = sys.stderr)
 					values[optname] = value
 				present[optname] = True
-		argv.pop(pos)
-	if extra:
-		return values, present
+			else:
+				# This is a short options argument.
+				optpos = 1
+				while optpos < len(current):
+					o = current[optpos]
+					optpos += 1
+					if o not in shorts:
+						print('Warning: short option %s is not recognized' % o, file = sys.stderr)
+						continue
+					optname = shorts[o]
+					opt = options[optname]
+					argtype = opt['argtype']
+					if argtype is bool:
+						# This option takes no argument.
+						value = opt['noarg']
+					elif opt['optional']:
+						# This option takes an optional argument.
+						if optpos < len(current):
+							value = _Deferred(opt['argtype'], current[optpos:]) if lazy else opt['argtype'](current[optpos:])
+						else:
+							value = opt['noarg']
+						optpos = len(current)
+					else:
+						# This option requires an argument.
+						if optpos < len(current):
+							value = _Deferred(opt['argtype'], current[optpos:]) if lazy else opt['argtype'](current[optpos:])
+						else:
+							arg = next_arg()
+							if arg is None:
+								print('Warning: option %s (%s) requires an argument' % (o, optname), file = sys.stderr)
+								break
+							value = _Deferred(opt['argtype'], arg) if lazy else opt['argtype'](arg)
+						optpos = len(current)
+					if opt['multiple']:
+						values[optname].append(value)
+					else:
+						if present[optname]:
+							print('Warning: option %s (%s) must only be passed once' % (o, optname), file = sys.stderr)
+						values[optname] = value
+					present[optname] = True
+		else:
+			# next_arg() may already have removed this source.
+			if len(sources) > 0 and sources[-1] is source:
+				sources.pop()
+	ret = (values, present) if extra else (values,)
+	if inplace:
+		argv[:] = remaining
 	else:
-		return values
+		ret += (remaining,)
+	return ret if len(ret) > 1 else ret[0]
+# }}}
+
+# Map of environment variable names to option names; built by init().
+_environment_keys = {}
+
+def _environment_name(name): # {{{
+	'''Compute the environment variable name for an option.'''
+	import re
+	return re.sub('[^A-Z0-9]', '_', (pname + '_' + name).upper())
+# }}}
+
+def _decode_environment(opt, value, lazy): # {{{
+	'''Convert the value of an environment variable for an option.
+	Booleans accept 1, true, yes and on, or 0, false, no, off and the empty
+	string.  Options that can be passed multiple times take a
+	comma-separated list.  Raises ValueError if the value is invalid.
+	'''
+	if opt['argtype'] is bool:
+		if value.lower() in ('1', 'true', 'yes', 'on'):
+			return True
+		if value.lower() in ('0', 'false', 'no', 'off', ''):
+			return False
+		raise ValueError('incorrect bool value %s' % value)
+	if opt['multiple']:
+		return [_Deferred(opt['argtype'], v) if lazy else opt['argtype'](v) for v in value.split(',')]
+	return _Deferred(opt['argtype'], value) if lazy else opt['argtype'](value)
+# }}}
+
+def _load_environment(values, present, options, lazy): # {{{
+	'''Set values that were not given on the commandline from the environment.
+	The variables are looked up through _environment_keys, which must have
+	been filled by init().
+	@return None.
+	'''
+	for envname, name in _environment_keys.items():
+		if present[name]:
+			continue
+		value = os.environ.get(envname)
+		if value is None:
+			continue
+		try:
+			values[name] = _decode_environment(options[name], value, lazy)
+		except ValueError:
+			print('Warning: error loading value for %s from %s; ignoring' % (name, envname), file = sys.stderr)
+			continue
+		present[name] = True
+# }}}
+
+# Startup timing. {{{
+# Phases of the most recent init(), as (name, seconds) pairs.
+_startup_phases = []
+
+def _phase(name, start): # {{{
+	'''Record a phase of init() that began at start.
+	@return The current time, which is the start of the next phase.
+	'''
+	now = time.perf_counter()
+	_startup_phases.append((name, now - start))
+	return now
+# }}}
+
+def _run_atinit(): # {{{
+	'''Run and time the functions that were registered with atinit().
+	Sequential hooks run on this thread in the order in which they were
+	registered.  Parallel hooks run on a thread pool as soon as their
+	dependencies are done.  Hooks may register more hooks.  This returns
+	when all hooks are done.
+	'''
+	pending = []
+	done = set()
+	running = {}
+	executor = None
+	def call(target, name):
+		start = time.perf_counter()
+		target()
+		_phase('atinit ' + name, start)
+	try:
+		while True:
+			pending.extend(_atinit)
+			del _atinit[:]
+			if len(pending) == 0 and len(running) == 0:
+				break
+			progress = False
+			blocked = False
+			for entry in list(pending):
+				target, name, depends, parallel = entry
+				for d in depends:
+					if _atinit_names.get(d, (0,))[0] > 1:
+						raise ValueError('atinit hook %s depends on %s, which is the name of more than one hook' % (name, d))
+				if (blocked and not parallel) or not all(d in done for d in depends):
+					if not parallel:
+						# Later sequential hooks must wait for this one.
+						blocked = True
+					continue
+				pending.remove(entry)
+				progress = True
+				label = name or getattr(target, '__qualname__', repr(target))
+				if parallel:
+					if executor is None:
+						import concurrent.futures
+						executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix = 'fhs-atinit')
+					running[executor.submit(call, target, label)] = name
+				else:
+					call(target, label)
+					done.add(name)
+					# The hook may have registered new hooks.
+					break
+			if progress:
+				continue
+			if len(running) == 0:
+				raise ValueError('atinit hooks have missing or circular dependencies: %s' % ', '.join(str(e[1] or e[0]) for e in pending))
+			import concurrent.futures
+			finished, unused = concurrent.futures.wait(running, return_when = concurrent.futures.FIRST_COMPLETED)
+			for future in finished:
+				name = running.pop(future)
+				future.result()
+				done.add(name)
+	finally:
+		if executor is not None:
+			executor.shutdown()
+# }}}
+
+def startup_report(): # {{{
+	'''Report how long the phases of init() took.
+	Passing --fhs-startup-profile on the commandline prints this report
+	when init() is done.
+	@return A list of dicts with keys 'phase' (the name) and 'seconds', in
+		the order in which they ran.  Every function registered with
+		atinit() is a separate phase.  Hooks that were registered with
+		parallel = True may overlap.
+	'''
+	return [{'phase': name, 'seconds': seconds} for name, seconds in _startup_phases]
+# }}}
+
+def _print_startup_report(total, file = None): # {{{
+	if file is None:
+		file = sys.stderr
+	print('fhs startup: %.3f ms total' % (total * 1e3), file = file)
+	for name, seconds in _startup_phases:
+		print('\t%.3f ms\t%s' % (seconds * 1e3, name), file = file)
+# }}}
 # }}}
 
-def init(config = None, help = None, version = None, contact = None, packagename = None, system = None, game = False):	# {{{
+def init(config = None, help = None, version = None, contact = None, packagename = None, system = None, game = False, indexed = False, manifest = False, config_snapshot = False, layered_config = False, lazy = False, environment = False, inherit = False, abbreviations = False, response_files = False):	# {{{
 	'''Initialize the module.
 	This function must be called before any other in this module (except
 	module_init(), which must be called before this function).
@@ -585,34 +1959,87 @@ def init(config = None, help = None, version = None, contact = None, packagename
 		paths will be ignored for reading.
 	@param game: If True, game system directories will be used (/usr/games,
 		/usr/share/games, etc.) instead of regular system directories.
+	@param indexed: If True, read_config() and read_data() scan each
+		directory in the search path once with os.scandir() and answer
+		lookups from those listings instead of calling stat() for every
+		candidate.  Files that are created by other processes are only
+		found after calling invalidate().
+	@param manifest: If True, load the lookup results that were stored
+		with freeze() (or "python3 -m fhs freeze"), if they are still
+		valid.  Lookups that are in the manifest do not touch the
+		filesystem.
+	@param config_snapshot: If True, keep a compiled snapshot of the
+		parsed configuration file in the cache directory, and use it
+		instead of parsing the file as long as the file and the
+		registered options are unchanged.
+	@param layered_config: If True, merge the configuration files from all
+		config directories instead of using only the first one that is
+		found.  Files in the user's directory override those in
+		XDG_CONFIG_DIRS, which override those in /etc/xdg.
+	@param lazy: If True, the returned configuration is a mapping that
+		converts values with their argtype only when they are first
+		used, instead of a dict with all values converted.  Invalid
+		values on the commandline raise ValueError when they are used,
+		instead of showing the help text.
+	@param environment: If True, options that are not given on the
+		commandline are read from environment variables named
+		<PACKAGENAME>_<OPTION>, or <PACKAGENAME>_<MODULE>_<OPTION> for
+		module options.  Names are uppercased and all characters other
+		than letters and digits are replaced by underscores.  These
+		values override the configuration file.
+	@param inherit: If True and the parent process called publish(), use
+		its configuration and lookup results.  The commandline and the
+		config file are not read in that case, and the other parameters
+		except packagename are ignored.  Config hooks registered with
+		atinit() are still run.
+	@param abbreviations: If True, long options on the commandline may be
+		abbreviated, as long as the abbreviation is unambiguous.  The
+		compiled list of options is kept in the cache directory.
+	@param response_files: If True, commandline arguments of the form
+		@path are replaced by the lines of that file, which are read
+		while parsing.  This allows passing more arguments than the
+		system allows on a commandline.
 	@return Configuration from commandline and config file.
 		This is a dict with the same keys as were previously passed
 		through calls to option(), with the values that were specified
 		as their values.  
 	'''
+	import atexit
 	global initialized
 	assert not initialized
+	global _values, _present
+	del _startup_phases[:]
+	start = began = time.perf_counter()
+	if inherit and _inherit(packagename):
+		_phase('inherit', start)
+		initialized = None
+		_run_atinit()
+		initialized = True
+		return _values
 	global pname
 	if packagename is not None:
 		pname = packagename
 	global is_system
 	global is_game
 	is_game = game
+	global is_indexed
+	is_indexed = indexed
 	if config is not None:
 		print('Warning: using the config parameter for fhs.init() is DEPRECATED! Use option() instead.', file = sys.stderr)
 		for key in config:
 			option(key, 'no help for this option', default = config[key])
 	global XDG_RUNTIME_DIR
-	global _values, _present
 	global _info
 	_info = {'help': help, 'version': version, 'contact': contact}
 	# If these default options are passed by the user, this will raise an exception.
 	first_options = {}
 	option_order = []
-	option('help', 'Show this help text', short = None if any(_options[o]['short'] == 'h' for o in _options) else 'h', argtype = bool, options = first_options, option_order = option_order) 
-	option('version', 'Show version information', short = None if any(_options[o]['short'] == 'v' for o in _options) else 'v', argtype = bool, options = first_options, option_order = option_order) 
+	option('help', 'Show this help text', short = None if 'h' in _shorts else 'h', argtype = bool, options = first_options, option_order = option_order) 
+	option('version', 'Show version information', short = None if 'v' in _shorts else 'v', argtype = bool, options = first_options, option_order = option_order) 
 	option('configfile', 'Use this file for loading and/or saving commandline configuration', default = 'commandline', options = first_options, option_order = option_order)
 	option('saveconfig', 'Save active commandline configuration as default or to the named file', optional = True, default = None, noarg = '', argtype = str, options = first_options, option_order = option_order)
+	option('fhs-trace', 'Trace file lookups and print a summary at exit', argtype = bool, options = first_options, option_order = option_order)
+	option('fhs-startup-profile', 'Show how long the phases of initialization took', argtype = bool, options = first_options, option_order = option_order)
 	if system is None:
 		option('system', 'Use only system paths', argtype = bool, options = first_options, option_order = option_order)
 	else:
@@ -620,8 +2047,22 @@ def init(config = None, help = None, version = None, contact = None, packagename
 	options = first_options.copy()
 	options.update(_options)
 	option_order += _option_order
+	start = _phase('merge options', start)
 	try:
-		_values, _present = parse_args(sys.argv, options, extra = True)
+		_values, _present = parse_args(sys.argv, options, extra = True, lazy = lazy, abbreviations = abbreviations, response_files = response_files)
+		start = _phase('parse_args', start)
+		if environment:
+			_environment_keys.clear()
+			for name in _options:
+				envname = _environment_name(name)
+				if envname in _environment_keys:
+					print('Warning: options %s and %s both use environment variable %s; ignoring %s' % (_environment_keys[envname], name, envname, name), file = sys.stderr)
+					continue
+				_environment_keys[envname] = name
+			_load_environment(_values, _present, options, lazy)
+			start = _phase('environment', start)
+		if lazy:
+			_values = _LazyConfig(_values)
 	except ValueError as err:
 		# Error parsing options.
 		print('Error parsing arguments: %s' % str(err))
@@ -637,19 +2078,35 @@ def init(config = None, help = None, version = None, contact = None, packagename
 	_values.pop('version')
 	configfile = _values.pop('configfile')
 	saveconfig = _values.pop('saveconfig')
+	if _values.pop('fhs-trace'):
+		trace()
+		atexit.register(trace_report)
+	startup_profile = _values.pop('fhs-startup-profile')
 	if system is None:
 		is_system = _values['system']
 
 	initialized = None
+	if manifest:
+		load_manifest()
+		start = _phase('load_manifest', start)
 	if saveconfig == '':
 		saveconfig = configfile
-	load_config(configfile, _values, _present, options)
+	global _load_args, _cmdline_keys
+	_load_args = (configfile, options, config_snapshot, layered_config)
+	_cmdline_keys = set(key for key in _present if _present[key])
+	load_config(configfile, _values, _present, options, config_snapshot, layered_config, lazy)
+	start = _phase('load_config', start)
 	if saveconfig is not None:
 		save_config({key: _values[key] for key in _values if _present[key]}, saveconfig, packagename)
+		start = _phase('save_config', start)
 	# Split out the module options into their own object.
 	for module in _module_config:
-		_module_values[module] = {key: _values.pop(module + '-' + key) for key in _module_config[module]}
+		if lazy:
+			_module_values[module] = _values._extract({key: module + '-' + key for key in _module_config[module]})
+		else:
+			_module_values[module] = {key: _values.pop(module + '-' + key) for key in _module_config[module]}
 		_module_present[module] = {key: _present.pop(module + '-' + key) for key in _module_config[module]}
+	start = _phase('split module options', start)
 	# system may have been updated. Record the new value. Do this after
 	# save_config, because it should save in the location where read_config
 	# searches for it.
@@ -657,26 +2114,54 @@ def init(config = None, help = None, version = None, contact = None, packagename
 		is_system = _values.pop('system')
 	@atexit.register
 	def clean_temps():
+		import shutil
 		for f in _tempfiles:
 			try:
 				os.unlink(f)
 			except:
 				shutil.rmtree(f, ignore_errors = True)
-	if XDG_RUNTIME_DIR is None:
+	if _path('XDG_RUNTIME_DIR') is None:
 		XDG_RUNTIME_DIR = write_temp(dir = True)
-	while len(_atinit) > 0:
-		_atinit.pop(0)()
+		start = _phase('create runtime dir', start)
+	_run_atinit()
 	initialized = True
+	if startup_profile:
+		_print_startup_report(time.perf_counter() - began)
 	return _values
 # }}}
 
-def atinit(target): # {{{
+def atinit(target = None, name = None, depends = (), parallel = False): # {{{
 	'''Decorator for registering a function at init.
-	This can also be called as a regular function.'''
+	This can also be called as a regular function.  When used with
+	keyword arguments, it returns the decorator.
+	@param target: The function to call.
+	@param name: Name of the hook, for use in depends of other hooks.
+		Defaults to the name of the function.  Explicit names must be
+		unique; default names may be shared, but then no hook can
+		depend on them.
+	@param depends: Names of hooks that must be done before this one is
+		called.
+	@param parallel: If True, the hook may run on a separate thread,
+		concurrently with other hooks.  If False (the default), it runs
+		on the main thread, after all sequential hooks that were
+		registered before it.  init() waits for all hooks before it
+		returns.
+	@return The target, or the decorator if target is None.
+	'''
 	# Initialized is False at boot, None during initialization and True after.
 	# Allow adding new atinit tasks from running atinit tasks, so only check for True.
 	assert initialized is not True
-	_atinit.append(target)
+	if target is None:
+		return lambda target: atinit(target, name, depends, parallel)
+	explicit = name is not None
+	if not explicit:
+		name = getattr(target, '__name__', None)
+	if name is not None:
+		count, was_explicit = _atinit_names.get(name, (0, False))
+		if count > 0 and (explicit or was_explicit):
+			raise ValueError('duplicate atinit hook %s defined' % name)
+		_atinit_names[name] = (count + 1, explicit)
+	_atinit.append((target, name, tuple(depends), parallel))
 	return target
 # }}}
 
@@ -690,7 +2175,9 @@ def get_config(extra = False): # {{{
 
 	@param extra: if True, return dict of which values were not using their defaults as well.
 	@return configuration dict, and possibly present dict, with the same
-		format as the return value of init().
+		format as the return value of init().  If init() was called with
+		lazy = True, the configuration is a mapping that decodes values
+		on first access.
 	'''
 	if initialized is False:
 		print('Warning: init() should be called before get_config() to set program information', file = sys.stderr)
@@ -771,9 +2258,185 @@ def module_get_config(modulename, extra = False): # {{{
 # }}}
 # }}}
 
+# Config reloading. {{{
+# Arguments that init() used for load_config(), and the keys that were set on
+# the commandline or in the environment.
+_load_args = None
+_cmdline_keys = set()
+# Callbacks for config changes, keyed by option name, or None for all.
+_change_callbacks = {}
+_watcher = None
+
+def on_config_change(key, callback): # {{{
+	'''Register a function to call when the configuration changes.
+	Changes are detected by reload_config(), which is called by the
+	watcher thread that watch_config() starts.
+	@param key: Name of the option to watch, or None for all options.
+		Module options use their full name, "<module>-<name>".
+	@param callback: Function that is called with a dict of the changed
+		options and their new values.  If key is not None, the dict
+		only contains that key.  When called from the watcher, this
+		runs in the watcher thread.
+	@return The callback, so this can be used as a decorator factory.
+	'''
+	_change_callbacks.setdefault(key, []).append(callback)
+	return callback
+# }}}
+
+def _config_slot(key): # {{{
+	'''Find the mapping that holds an option's value.'''
+	module = _options[key]['module']
+	if module is None:
+		return _values, key
+	return _module_values[module], key[len(module) + 1:]
+# }}}
+
+def reload_config(): # {{{
+	'''Load the configuration files again and apply changes.
+	Options that were passed on the commandline keep their value.  All
+	other options get the value from the configuration file, or their
+	default.  Callbacks that were registered with on_config_change() are
+	called for the options that changed.
+	@return A dict of the changed options and their new values.
+	'''
+	assert initialized is True
+	filename, options, snapshot, layered = _load_args
+	# The file may be in a directory that did not exist before.
+	_forget_dirs('config')
+	values = {name: [] if options[name]['multiple'] else options[name]['default'] for name in options}
+	present = {name: name in _cmdline_keys for name in options}
+	load_config(filename, values, present, options, snapshot, layered)
+	changed = {}
+	for key in _options:
+		if key in _cmdline_keys:
+			continue
+		target, name = _config_slot(key)
+		if target[name] != values[key]:
+			target[name] = values[key]
+			changed[key] = values[key]
+	if len(changed) > 0:
+		for callback in _change_callbacks.get(None, ()):
+			callback(dict(changed))
+		for key in changed:
+			for callback in _change_callbacks.get(key, ()):
+				callback({key: changed[key]})
+	return changed
+# }}}
+
+def _config_files(): # {{{
+	'''List all paths where the loaded configuration may be found.'''
+	dirs = _config_dirs(True, None)
+	return [os.path.join(d, _load_args[0] + os.extsep + ext) for ext in ('ini', 'journal') for d in dirs]
+# }}}
+
+def _inotify(dirs): # {{{
+	'''Set up inotify watches for directories.
+	@return The inotify file descriptor, or None if inotify is not available.
+	'''
+	try:
+		import ctypes
+		import ctypes.util
+		libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+		fd = libc.inotify_init1(os.O_CLOEXEC)
+	except (ImportError, OSError, AttributeError):
+		return None
+	if fd < 0:
+		return None
+	# IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+	mask = 0x2 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200
+	for d in dirs:
+		libc.inotify_add_watch(fd, os.fsencode(d), mask)
+	return fd
+# }}}
+
+def _inotify_names(fd): # {{{
+	'''Read pending inotify events and return the names in them.'''
+	data = os.read(fd, 65536)
+	names = set()
+	pos = 0
+	while pos + 16 <= len(data):
+		length = struct.unpack_from('iIII', data, pos)[3]
+		names.add(os.fsdecode(data[pos + 16:pos + 16 + length].rstrip(b'\0')))
+		pos += 16 + length
+	return names
+# }}}
+
+def watch_config(interval = 1.): # {{{
+	'''Start a thread that reloads the configuration when it changes.
+	The thread uses inotify to watch the configuration directories if it
+	is available.  It also checks the modification times of the files
+	every interval seconds, which catches files in directories that did not
+	exist when watching started.  When a file changes, reload_config() is
+	called.  Use on_config_change() to be notified of changes.
+	@param interval: Polling interval in seconds.
+	@return None.
+	'''
+	global _watcher
+	assert initialized is True
+	if _watcher is not None:
+		return
+	stop = threading.Event()
+	def stamps(paths):
+		ret = []
+		for path in paths:
+			# Don't use _stat(), which counts the call.
+			try:
+				st = os.stat(path)
+			except OSError:
+				st = None
+			ret.append(None if st is None else (st.st_ino, st.st_size, st.st_mtime_ns))
+		return ret
+	# Set up the watches before returning, so that no change made after
+	# this call is missed.
+	paths = _config_files()
+	dirs = sorted(set(os.path.dirname(p) or os.path.curdir for p in paths))
+	fd = _inotify([d for d in dirs if os.path.isdir(d)])
+	names = set(os.path.basename(p) for p in paths)
+	initial = stamps(paths)
+	def run():
+		last = initial
+		try:
+			while not stop.is_set():
+				if fd is None:
+					stop.wait(interval)
+				elif len(select.select([fd], [], [], interval)[0]) > 0:
+					if names.isdisjoint(_inotify_names(fd)):
+						continue
+					# Let the writer finish before reading the file.
+					stop.wait(.05)
+				# On timeout, check anyway; the file may have been
+				# created in a directory that could not be watched.
+				current = stamps(paths)
+				if current != last:
+					last = current
+					try:
+						reload_config()
+					except Exception as err:
+						print('Warning: error reloading configuration: %s' % err, file = sys.stderr)
+		finally:
+			if fd is not None:
+				os.close(fd)
+	_watcher = (threading.Thread(target = run, daemon = True), stop)
+	_watcher[0].start()
+# }}}
+
+def unwatch_config(): # {{{
+	'''Stop the thread that was started by watch_config().
+	@return None.
+	'''
+	global _watcher
+	if _watcher is None:
+		return
+	thread, stop = _watcher
+	stop.set()
+	thread.join()
+	_watcher = None
+# }}}
+# }}}
+
 # Runtime files. {{{
 ## XDG runtime directory.  Note that XDG does not specify a default for this.  This module uses /run as the default for system services.
-XDG_RUNTIME_DIR = os.getenv('XDG_RUNTIME_DIR')
+_path_defaults['XDG_RUNTIME_DIR'] = lambda: os.getenv('XDG_RUNTIME_DIR')
 def _runtime_get(name, packagename, dir):
 	assert initialized is not False
 	if name is None:
@@ -783,11 +2446,12 @@ def _runtime_get(name, packagename, dir):
 			name = (packagename or pname) + os.extsep + 'txt'
 	else:
 		name = os.path.join(packagename or pname, name)
-	d = '/run' if is_system else XDG_RUNTIME_DIR
+	d = '/run' if is_system else _path('XDG_RUNTIME_DIR')
 	target = os.path.join(d, name)
 	d = target if dir else os.path.dirname(target)
 	return d, target
 
+@_traced
 def write_runtime(name = None, text = True, dir = False, opened = True, packagename = None):
 	'''Open a runtime file for writing.
 	@param name: Filename to open.  Defaults to the program name.
@@ -798,10 +2462,11 @@ def write_runtime(name = None, text = True, dir = False, opened = True, packagen
 	@return The opened file, or the file or directory name.
 	'''
 	d, target = _runtime_get(name, packagename, dir)
-	if opened and not os.path.exists(d):
+	if opened and _stat(d) is None:
 		os.makedirs(d)
 	return open(target, 'w+' if text else 'w+b') if opened and not dir else target
 
+@_traced
 def read_runtime(name = None, text = True, dir = False, opened = True, packagename = None):
 	'''Open a runtime file for reading.
 	@param name: Filename to open.  Defaults to the program name.
@@ -812,8 +2477,10 @@ def read_runtime(name = None, text = True, dir = False, opened = True, packagena
 	@return The opened file, or the file or directory name.
 	'''
 	d, target = _runtime_get(name, packagename, dir)
-	if os.path.exists(target) and (dir if os.path.isdir(target) else not dir):
-		return open(target, 'r' if text else 'rb') if opened and not dir else target
+	_begin_lookup()
+	st = _stat(target)
+	if st is not None and stat.S_ISDIR(st.st_mode) == dir:
+		return _open(target, text) if opened and not dir else target
 	return None
 
 def remove_runtime(name = None, dir = False, packagename = None):
@@ -824,6 +2491,7 @@ def remove_runtime(name = None, dir = False, packagename = None):
 	@param packagename: Override the packagename.
 	@return None.
 	'''
+	import shutil
 	assert initialized is not False
 	if dir:
 		shutil.rmtree(read_runtime(name, False, True, False, packagename), ignore_errors = False)
@@ -855,6 +2523,7 @@ class _TempFile:
 		self.remove()
 		return False
 
+@_traced
 def write_temp(dir = False, text = True, packagename = None):
 	'''Open a temporary file for writing.
 	The file is automatically removed when the program exits.  If this
@@ -877,6 +2546,7 @@ def write_temp(dir = False, text = True, packagename = None):
 	@param packagename: Override the packagename.
 	@return The file, or the name of the directory.
 	'''
+	import tempfile
 	assert initialized is not False
 	if dir:
 		ret = tempfile.mkdtemp(prefix = (packagename or pname) + '-')
@@ -895,6 +2565,7 @@ def remove_temp(name):
 	@param name: The name of the directory, as returned by write_temp.
 	@return None.
 	'''
+	import shutil
 	assert initialized is not False
 	assert name in _tempfiles
 	_tempfiles.remove(name)
@@ -903,10 +2574,11 @@ def remove_temp(name):
 
 # Data files. {{{
 ## XDG data directory.
-XDG_DATA_HOME = os.getenv('XDG_DATA_HOME', os.path.join(HOME, '.local', 'share'))
+_path_defaults['XDG_DATA_HOME'] = lambda: os.getenv('XDG_DATA_HOME', os.path.join(_path('HOME'), '.local', 'share'))
 ## XDG data directory search path.
-XDG_DATA_DIRS = os.getenv('XDG_DATA_DIRS', '/usr/local/share:/usr/share').split(':')
+_path_defaults['XDG_DATA_DIRS'] = lambda: os.getenv('XDG_DATA_DIRS', '/usr/local/share:/usr/share').split(':')
 
+@_traced
 def write_data(name = None, text = True, dir = False, opened = True, packagename = None):
 	'''Open a data file for writing.  The file is not truncated if it exists.
 	@param name: Name of the data file.
@@ -917,6 +2589,7 @@ def write_data(name = None, text = True, dir = False, opened = True, packagename
 	@return The opened file, or the name of the file or directory.
 	'''
 	assert initialized is not False
+	_forget_dirs('data')
 	if name is None:
 		if dir:
 			filename = packagename or pname
@@ -936,50 +2609,31 @@ def write_data(name = None, text = True, dir = False, opened = True, packagename
 			else:
 				d = os.path.join('/var/lib', pname)
 	else:
-		d = XDG_DATA_HOME
+		d = _path('XDG_DATA_HOME')
 	target = os.path.join(d, filename)
 	if dir:
-		if opened and not os.path.exists(target):
+		if opened and _stat(target) is None:
 			os.makedirs(target)
 		return target
 	else:
 		d = os.path.dirname(target)
-		if opened and not os.path.exists(d):
+		if opened and _stat(d) is None:
 			os.makedirs(d)
 		return open(target, 'w+' if text else 'w+b') if opened else target
 
-def read_data(name = None, text = True, dir = False, multiple = False, opened = True, packagename = None):
-	'''Open a data file for reading.  The paramers should be identical to what was used to create the file with write_data().
-	@param name: Name of the data file.
-	@param text: Open as a text file if True (the default).
-	@param dir: Return a directory name if True, a file or filename if False (the default).
-	@param opened: Open the file if True (the default), report the name if False.
-	@param packagename: Override the packagename.
-	@return The opened file, or the name of the file or directory.
+def _data_dirs(named, packagename):
+	'''List the directories that read_data() searches, in order.
+	@param named: True if a name was passed to read_data().  The user
+		directory includes the package name only in that case.
 	'''
-	assert initialized is not False
-	if name is None:
-		if dir:
-			filename = packagename or pname
-		else:
-			filename = (packagename or pname) + os.extsep + 'dat'
-	else:
-		filename = name
-	seen = set()
-	target = []
+	ret = []
 	if not is_system:
-		t = os.path.join(XDG_DATA_HOME, filename if name is None else os.path.join(packagename or pname, name))
-		if os.path.realpath(t) not in seen and os.path.exists(t) and (dir if os.path.isdir(t) else not dir):
-			r = t if dir or not opened else open(t, 'r' if text else 'rb')
-			if not multiple:
-				return r
-			seen.add(os.path.realpath(t))
-			target.append(r)
+		ret.append(os.path.join(_path('XDG_DATA_HOME'), packagename or pname) if named else _path('XDG_DATA_HOME'))
 	dirs = ['/var/local/lib', '/var/lib', '/usr/local/lib', '/usr/lib', '/usr/local/share', '/usr/share']
 	if is_game:
 		dirs = ['/var/local/games', '/var/games', '/usr/local/lib/games', '/usr/lib/games', '/usr/local/share/games', '/usr/share/games'] + dirs
 	if not is_system:
-		for d in XDG_DATA_DIRS[::-1]:
+		for d in _path('XDG_DATA_DIRS')[::-1]:
 			dirs.insert(0, d)
 	if packagename and packagename != pname:
 		dirs = [os.path.join(x, pname, packagename) for x in dirs] + [os.path.join(x, packagename) for x in dirs]
@@ -989,18 +2643,64 @@ def read_data(name = None, text = True, dir = False, multiple = False, opened =
 		dirs.insert(0, packagename or pname)
 		dirs.insert(0, os.path.curdir)
 		dirs.insert(0, _base)
-	for d in dirs:
-		t = os.path.join(d, filename)
-		if os.path.realpath(t) not in seen and os.path.exists(t) and (dir if os.path.isdir(t) else not dir):
-			r = t if dir or not opened else open(t, 'r' if text else 'rb')
-			if not multiple:
-				return r
-			seen.add(os.path.realpath(t))
-			target.append(r)
-	if multiple:
-		return target
+	ret.extend(dirs)
+	return ret
+
+def _data_candidates(name, dir, packagename):
+	if name is None:
+		if dir:
+			filename = packagename or pname
+		else:
+			filename = (packagename or pname) + os.extsep + 'dat'
 	else:
-		return None
+		filename = name
+	return [os.path.join(d, filename) for d in _search_path('data', _data_dirs, name is not None, packagename)]
+
+@_traced
+def read_data(name = None, text = True, dir = False, multiple = False, opened = True, packagename = None, mmap = False):
+	'''Open a data file for reading.  The paramers should be identical to what was used to create the file with write_data().
+	@param name: Name of the data file.
+	@param text: Open as a text file if True (the default).
+	@param dir: Return a directory name if True, a file or filename if False (the default).
+	@param opened: Open the file if True (the default), report the name if False.
+	@param packagename: Override the packagename.
+	@param mmap: If True, return a read-only mmap object of the file
+		instead of a file object.  The text parameter is ignored.  An
+		empty file cannot be mapped; for it an empty memoryview is
+		returned.  The caller should close the map when done with it.
+	@return The opened file, or the name of the file or directory.
+	'''
+	assert initialized is not False
+	_begin_lookup()
+	result = _resolve('data', _data_candidates, name, dir, multiple, packagename)
+	if dir or not opened:
+		return list(result) if multiple else result
+	if multiple:
+		return [_open(t, text, mmap) for t in result]
+	return None if result is None else _open(result, text, mmap)
+
+@_traced
+def read_data_many(names, text = True, dir = False, opened = True, packagename = None):
+	'''Open several data files for reading.
+	This is equivalent to calling read_data() for every name, but the
+	search path is walked only once.
+	@param names: Iterable of names of data files.
+	@param text: Open as text files if True (the default).
+	@param dir: Return directory names if True, files or filenames if False (the default).
+	@param opened: Open the files if True (the default), report the names if False.
+	@param packagename: Override the packagename.
+	@return A dict with the opened file, or the name of the file or
+		directory, for every name.  Names that are not found map to
+		None.
+	'''
+	assert initialized is not False
+	_begin_lookup()
+	ret = _resolve_many(_search_path('data', _data_dirs, True, packagename), names, dir)
+	if opened and not dir:
+		for name in ret:
+			if ret[name] is not None:
+				ret[name] = _open(ret[name], text)
+	return ret
 
 def remove_data(name = None, dir = False, packagename = None):
 	'''Remove a data file.  Use the same parameters as were used to create it with write_data().
@@ -1009,6 +2709,7 @@ def remove_data(name = None, dir = False, packagename = None):
 	@param packagename: Override the packagename.
 	@return None.
 	'''
+	import shutil
 	assert initialized is not False
 	if dir:
 		shutil.rmtree(read_data(name, False, True, False, False, packagename), ignore_errors = False)
@@ -1018,8 +2719,9 @@ def remove_data(name = None, dir = False, packagename = None):
 
 # Cache files. {{{
 ## XDG cache directory.
-XDG_CACHE_HOME = os.getenv('XDG_CACHE_HOME', os.path.join(HOME, '.cache'))
+_path_defaults['XDG_CACHE_HOME'] = lambda: os.getenv('XDG_CACHE_HOME', os.path.join(_path('HOME'), '.cache'))
 
+@_traced
 def write_cache(name = None, text = True, dir = False, opened = True, packagename = None):
 	'''Open a cache file for writing.  The file is not truncated if it exists.
 	@param name: Name of the cache file.
@@ -1030,6 +2732,7 @@ def write_cache(name = None, text = True, dir = False, opened = True, packagenam
 	@return The opened file, or the name of the file or directory.
 	'''
 	assert initialized is not False
+	_invalidate('cache')
 	if name is None:
 		if dir:
 			filename = packagename or pname
@@ -1037,25 +2740,30 @@ def write_cache(name = None, text = True, dir = False, opened = True, packagenam
 			filename = (packagename or pname) + os.extsep + 'dat'
 	else:
 		filename = name if is_system else os.path.join(packagename or pname, name)
-	d = os.path.join('/var/cache', packagename or pname) if is_system else XDG_CACHE_HOME
+	d = os.path.join('/var/cache', packagename or pname) if is_system else _path('XDG_CACHE_HOME')
 	target = os.path.join(d, filename)
 	if dir:
-		if opened and not os.path.exists(target):
+		if opened and _stat(target) is None:
 			os.makedirs(target)
 		return target
 	else:
 		d = os.path.dirname(target)
-		if opened and not os.path.exists(d):
+		if opened and _stat(d) is None:
 			os.makedirs(d)
 		return open(target, 'w+' if text else 'w+b') if opened and not dir else target
 
-def read_cache(name = None, text = True, dir = False, opened = True, packagename = None):
+@_traced
+def read_cache(name = None, text = True, dir = False, opened = True, packagename = None, mmap = False):
 	'''Open a cache file for reading.  The paramers should be identical to what was used to create the file with write_cache().
 	@param name: Name of the cache file.
 	@param text: Open as a text file if True (the default).
 	@param dir: Return a directory name if True, a file or filename if False (the default).
 	@param opened: Open the file if True (the default), report the name if False.
 	@param packagename: Override the packagename.
+	@param mmap: If True, return a read-only mmap object of the file
+		instead of a file object.  The text parameter is ignored.  An
+		empty file cannot be mapped; for it an empty memoryview is
+		returned.  The caller should close the map when done with it.
 	@return The opened file, or the name of the file or directory.
 	'''
 	assert initialized is not False
@@ -1066,15 +2774,20 @@ def read_cache(name = None, text = True, dir = False, opened = True, packagename
 			filename = (packagename or pname) + os.extsep + 'dat'
 	else:
 		filename = os.path.join(packagename or pname, name)
-	target = os.path.join(XDG_CACHE_HOME, filename)
-	if not os.path.exists(target):
+	_begin_lookup()
+	key = ('cache', name, packagename, dir, is_system)
+	if _known_miss(key):
+		return None
+	target = os.path.join(_path('XDG_CACHE_HOME'), filename)
+	if _stat(target) is None:
 		if name is None:
 			filename = os.path.join(packagename or pname, packagename or pname + os.extsep + 'dat')
 		d = '/var/cache'
 		target = os.path.join(d, filename)
-		if not os.path.exists(target):
+		if _stat(target) is None:
+			_record_miss(key)
 			return None
-	return open(target, 'r' if text else 'rb') if opened and not dir else target
+	return _open(target, text, mmap) if opened and not dir else target
 
 def remove_cache(name = None, dir = False, packagename = None):
 	'''Remove a cache file.  Use the same parameters as were used to create it with write_cache().
@@ -1083,6 +2796,7 @@ def remove_cache(name = None, dir = False, packagename = None):
 	@param packagename: Override the packagename.
 	@return None.
 	'''
+	import shutil
 	assert initialized is not False
 	if dir:
 		shutil.rmtree(read_cache(name, False, True, False, packagename), ignore_errors = False)
@@ -1091,6 +2805,7 @@ def remove_cache(name = None, dir = False, packagename = None):
 # }}}
 
 # Log files. {{{
+@_traced
 def write_log(name = None, packagename = None):
 	'''Open a log file for writing.
 	There are not many options here; logfiles are always opened for append,
@@ -1109,12 +2824,13 @@ def write_log(name = None, packagename = None):
 		filename = os.path.join(packagename or pname, name)
 	target = os.path.join('/var/log', filename)
 	d = os.path.dirname(target)
-	if not os.path.exists(d):
+	if _stat(d) is None:
 		os.makedirs(d)
 	return open(target, 'a')
 # }}}
 
 # Spool files. {{{
+@_traced
 def write_spool(name = None, text = True, dir = False, opened = True, packagename = None):
 	'''Open a spool file for writing.  The file is not truncated if it exists.
 	Users don't have spool directories by default.  A directory named
@@ -1127,6 +2843,7 @@ def write_spool(name = None, text = True, dir = False, opened = True, packagenam
 	@return The opened file, or the name of the file or directory.
 	'''
 	assert initialized is not False
+	_invalidate('spool')
 	if name is None:
 		if dir:
 			filename = packagename or pname
@@ -1134,12 +2851,13 @@ def write_spool(name = None, text = True, dir = False, opened = True, packagenam
 			filename = (packagename or pname) + os.extsep + 'dat'
 	else:
 		filename = os.path.join(packagename or pname, name)
-	target = os.path.join('/var/spool' if is_system else os.path.join(XDG_CACHE_HOME, 'spool'), filename)
+	target = os.path.join('/var/spool' if is_system else os.path.join(_path('XDG_CACHE_HOME'), 'spool'), filename)
 	d = os.path.dirname(target)
-	if opened and not os.path.exists(d):
+	if opened and _stat(d) is None:
 		os.makedirs(d)
 	return open(target, 'w+' if text else 'w+b') if opened and not dir else target
 
+@_traced
 def read_spool(name = None, text = True, dir = False, opened = True, packagename = None):
 	'''Open a spool file for reading.  The paramers should be identical to what was used to create the file with write_spool().
 	@param name: Name of the spool file.
@@ -1157,10 +2875,15 @@ def read_spool(name = None, text = True, dir = False, opened = True, packagename
 			filename = (packagename or pname) + os.extsep + 'dat'
 	else:
 		filename = os.path.join(packagename or pname, name)
-	target = os.path.join('/var/spool' if is_system else os.path.join(XDG_CACHE_HOME, 'spool'), filename)
-	if not os.path.exists(target):
+	_begin_lookup()
+	key = ('spool', name, packagename, dir, is_system)
+	if _known_miss(key):
+		return None
+	target = os.path.join('/var/spool' if is_system else os.path.join(_path('XDG_CACHE_HOME'), 'spool'), filename)
+	if _stat(target) is None:
+		_record_miss(key)
 		return None
-	return open(target, 'r' if text else 'rb') if opened and not dir else target
+	return _open(target, text) if opened and not dir else target
 
 def remove_spool(name = None, dir = False, packagename = None):
 	'''Remove a spool file.  Use the same parameters as were used to create it with write_spool().
@@ -1169,6 +2892,7 @@ def remove_spool(name = None, dir = False, packagename = None):
 	@param packagename: Override the packagename.
 	@return None.
 	'''
+	import shutil
 	assert initialized is not False
 	if name is None:
 		if dir:
@@ -1196,3 +2920,205 @@ def unlock(name = None, packagename = None):
 	assert initialized is not False
 	# TODO
 # }}}
+
+# Resolution manifest. {{{
+def _manifest_file(): # {{{
+	d = '/run' if is_system else _path('XDG_RUNTIME_DIR')
+	# A runtime directory that init() created is removed at exit, so no
+	# other process could use a manifest in it.
+	if d is None or d in _tempfiles:
+		return None
+	return os.path.join(d, pname, 'fhs-manifest' + os.extsep + 'json')
+# }}}
+
+def _manifest_state(): # {{{
+	'''Describe everything besides the directories that lookups depend on.'''
+	return {'pname': pname, 'system': is_system, 'game': is_game, 'base': _base, 'cwd': os.getcwd()}
+# }}}
+
+def freeze(config = (), data = ()): # {{{
+	'''Store the result of lookups for use by later processes.
+	The given names are looked up with read_config() and read_data(),
+	and these results plus all lookups that were done before are written
+	to a manifest in the runtime directory.  The modification times of
+	all directories in the search paths are stored with it.  A process
+	that passes manifest = True to init() uses these results as long as
+	none of those directories have changed.
+	This can also be done from the commandline with "python3 -m fhs
+	--packagename=<name> --base=<dir> freeze", where dir is the directory
+	that contains the program.  It must be run from the directory that the
+	program is started from.
+	@param config: Names of config files to look up.
+	@param data: Names of data files to look up.
+	@return The name of the manifest file, or None if there is no runtime
+		directory, or only a temporary one because XDG_RUNTIME_DIR is
+		not set.
+	'''
+	import json
+	assert initialized is not False
+	target = _manifest_file()
+	if target is None:
+		return None
+	entries = {}
+	for category in _resolved:
+		for key in _resolved[category]:
+			entries[(category,) + key] = _resolved[category][key][0]
+	for category, names, read in (('config', config, read_config), ('data', data, read_data)):
+		for name in names:
+			entries[(category, name, None, False, False, is_system, is_game)] = read(name, opened = False)
+	dirs = set()
+	for key in entries:
+		category, name, packagename, dir = key[:4]
+		dirs.update((_config_dirs if category == 'config' else _data_dirs)(name is not None, packagename))
+		candidates = _config_candidates if category == 'config' else _data_candidates
+		dirs.update(os.path.dirname(t) for t in candidates(name, dir, packagename))
+	manifest = _manifest_state()
+	manifest['dirs'] = sorted([d, _mtime(d)] for d in dirs)
+	manifest['entries'] = [[list(key), entries[key]] for key in entries]
+	d = os.path.dirname(target)
+	if _stat(d) is None:
+		os.makedirs(d)
+	with open(target, 'w') as f:
+		json.dump(manifest, f)
+	return target
+# }}}
+
+def load_manifest(): # {{{
+	'''Load lookup results that were stored with freeze().
+	This is called by init() if its manifest parameter is True.  The
+	manifest is ignored if it was made for a different program, working
+	directory or set of flags, or if any directory in it has changed.
+	@return True if the manifest was loaded, False otherwise.
+	'''
+	import json
+	target = _manifest_file()
+	if target is None:
+		return False
+	try:
+		with open(target) as f:
+			manifest = json.load(f)
+	except (OSError, ValueError):
+		return False
+	state = _manifest_state()
+	if any(manifest.get(key) != state[key] for key in state):
+		return False
+	if any(_mtime(d) != mtime for d, mtime in manifest['dirs']):
+		return False
+	for key, result in manifest['entries']:
+		_frozen[tuple(key)] = result
+	return True
+# }}}
+# }}}
+
+# Worker processes. {{{
+# Environment variable that tells child processes where the published state is.
+_INHERIT_VAR = 'FHS_INHERIT'
+
+def publish(): # {{{
+	'''Make the state of this process available to worker processes.
+	The configuration and the results of lookups that were done so far
+	are written to a file in the runtime directory, and its name is stored
+	in the environment, so that child processes inherit it.  A child that
+	calls init() with inherit = True uses this state instead of parsing
+	its commandline, reading config files and searching for files again.
+	This is meant for pools of processes that are started with
+	multiprocessing's 'spawn' method; forked processes already share the
+	state.  The file is removed when this process exits.  Processes that
+	inherit their state cannot use reload_config() or watch_config().
+	@return The name of the file.
+	'''
+	import atexit
+	import pickle
+	assert initialized is True
+	state = {
+		'pname': pname,
+		'system': is_system,
+		'game': is_game,
+		'indexed': is_indexed,
+		'runtime': _path('XDG_RUNTIME_DIR'),
+		'base': _base,
+		'values': dict(_values),
+		'present': _present,
+		'module_values': {module: dict(_module_values[module]) for module in _module_values},
+		'module_present': _module_present,
+		'resolved': _resolved,
+		'search_dirs': _search_dirs,
+		'frozen': _frozen,
+	}
+	target = write_runtime('fhs-inherit-%d' % os.getpid() + os.extsep + 'pickle', opened = False)
+	d = os.path.dirname(target)
+	if _stat(d) is None:
+		os.makedirs(d)
+	_write_atomic(target, pickle.dumps(state, pickle.HIGHEST_PROTOCOL), False)
+	if os.environ.get(_INHERIT_VAR) != target:
+		pid = os.getpid()
+		@atexit.register
+		def remove():
+			# Forked children run this too; only the publisher removes the file.
+			if os.getpid() == pid and _stat(target) is not None:
+				os.unlink(target)
+	os.environ[_INHERIT_VAR] = target
+	return target
+# }}}
+
+def _inherit(packagename): # {{{
+	'''Load the state that the parent process stored with publish().
+	@return True if the state was loaded, False if there is none.
+	'''
+	import pickle
+	global pname, is_system, is_game, is_indexed, XDG_RUNTIME_DIR, _base, _values, _present
+	path = os.environ.get(_INHERIT_VAR)
+	if path is None:
+		return False
+	try:
+		with open(path, 'rb') as f:
+			state = pickle.load(f)
+	except (OSError, pickle.UnpicklingError, EOFError) as err:
+		print('Warning: unable to inherit configuration from %s: %s' % (path, err), file = sys.stderr)
+		return False
+	if packagename is not None and packagename != state['pname']:
+		return False
+	pname = state['pname']
+	is_system = state['system']
+	is_game = state['game']
+	is_indexed = state['indexed']
+	XDG_RUNTIME_DIR = state['runtime']
+	_base = state['base']
+	_values = state['values']
+	_present = state['present']
+	_module_values.update(state['module_values'])
+	_module_present.update(state['module_present'])
+	for category in state['resolved']:
+		_resolved.setdefault(category, {}).update(state['resolved'][category])
+	_search_dirs.update(state['search_dirs'])
+	_frozen.update(state['frozen'])
+	return True
+# }}}
+# }}}
+
+# Commandline interface. {{{
+if __name__ == '__main__':
+	_commands = {}
+	_command_order = []
+	option('packagename', 'Name of the package to work on', options = _commands, option_order = _command_order)
+	option('base', 'Directory that contains the program; this must match the program that uses the manifest', options = _commands, option_order = _command_order)
+	option('system', 'Use only system paths', argtype = bool, options = _commands, option_order = _command_order)
+	option('game', 'Use game directories', argtype = bool, options = _commands, option_order = _command_order)
+	option('config', 'Config file name to include in the manifest', multiple = True, options = _commands, option_order = _command_order)
+	option('data', 'Data file name to include in the manifest', multiple = True, options = _commands, option_order = _command_order)
+	_args = parse_args(sys.argv, _commands)
+	# The manifest is only used by a program in the directory given with
+	# --base, and run from the current directory, so there is no sensible
+	# default for it.
+	if sys.argv[1:] != ['freeze'] or _args['packagename'] is None or _args['base'] is None:
+		print('usage: python3 -m fhs --packagename=<name> --base=<directory of the program> [--game] [--system] [--config=<name> ...] [--data=<name> ...] freeze', file = sys.stderr)
+		print('Run this from the directory that the program will be started from.', file = sys.stderr)
+		sys.exit(1)
+	_base = os.path.abspath(_args['base'])
+	init(packagename = _args['packagename'], system = _args['system'], game = _args['game'])
+	_manifest = freeze(config = ['commandline' + os.extsep + 'ini'] + _args['config'], data = _args['data'])
+	if _manifest is None:
+		print('fhs: cannot freeze: XDG_RUNTIME_DIR is not set, so the manifest would be removed at exit', file = sys.stderr)
+		sys.exit(1)
+	print(_manifest)
+# }}}
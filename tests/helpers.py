@@ -0,0 +1,63 @@
+# Helpers for the tests in this directory.
+# vim: set fileencoding=utf-8 foldmethod=marker :
+
+'''Every test runs its code in a fresh Python process, because fhs can only
+be initialized once per process.  The XDG directories point into a
+temporary directory, so the user's files are never touched.
+'''
+
+import os
+import sys
+import subprocess
+import tempfile
+import textwrap
+
+## Directory that contains fhs.py.
+SOURCE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def environment(base): # {{{
+	'''Create an environment with all XDG directories inside base.'''
+	env = dict(os.environ)
+	for var, sub in (('XDG_CONFIG_HOME', 'config'), ('XDG_DATA_HOME', 'data'), ('XDG_CACHE_HOME', 'cache'), ('XDG_RUNTIME_DIR', 'run')):
+		env[var] = os.path.join(base, sub)
+		os.makedirs(env[var], mode = 0o700, exist_ok = True)
+	env['XDG_CONFIG_DIRS'] = os.path.join(base, 'etc')
+	env['XDG_DATA_DIRS'] = os.path.join(base, 'share')
+	env['PYTHONPATH'] = SOURCE
+	return env
+# }}}
+
+def run(code, args = (), base = None): # {{{
+	'''Run code in a new process with fhs importable.
+	@param code: Python source; it is dedented first.
+	@param args: Commandline arguments for the program.
+	@param base: Directory for the XDG directories.  A new temporary
+		directory is used if this is None.
+	@return The output of the program.  A failing program raises
+		AssertionError with its error output.
+	'''
+	with tempfile.TemporaryDirectory() as tmp:
+		env = environment(tmp if base is None else base)
+		proc = subprocess.run([sys.executable, '-c', textwrap.dedent(code)] + list(args), env = env, cwd = tmp, capture_output = True, text = True)
+	if proc.returncode != 0:
+		raise AssertionError('test program failed:\n' + proc.stderr)
+	return proc.stdout
+# }}}
+
+def main(tests): # {{{
+	'''Run all test functions in a dict, such as globals() of a test module.
+	Exits with status 1 if any test fails.
+	'''
+	failed = 0
+	for name in sorted(tests):
+		if not name.startswith('test_') or not callable(tests[name]):
+			continue
+		try:
+			tests[name]()
+		except AssertionError as err:
+			failed += 1
+			print('FAIL %s: %s' % (name, err))
+		else:
+			print('ok   %s' % name)
+	sys.exit(1 if failed else 0)
+# }}}
@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+# Tests for hooks that are registered with atinit().
+# vim: set fileencoding=utf-8 foldmethod=marker :
+
+from helpers import run, main
+
+def test_dependencies(): # {{{
+	out = run('''
+	import fhs
+	@fhs.atinit(depends = ['first'], parallel = True)
+	def second():
+		print('second')
+	@fhs.atinit
+	def first():
+		print('first')
+	fhs.init(packagename = 'fhs-test')
+	''')
+	assert out.split() == ['first', 'second'], out
+# }}}
+
+def test_duplicate_explicit(): # {{{
+	out = run('''
+	import fhs
+	fhs.atinit(lambda: None, name = 'setup')
+	for target, name in ((lambda: None, 'setup'), (print, None)):
+		try:
+			fhs.atinit(target, name = name)
+		except ValueError as err:
+			print(err)
+	def setup():
+		pass
+	try:
+		fhs.atinit(setup)
+	except ValueError as err:
+		print(err)
+	''')
+	assert out.splitlines() == ['duplicate atinit hook setup defined'] * 2, out
+# }}}
+
+def test_shared_default_name(): # {{{
+	# Hooks from different modules may have the same function name, as
+	# long as nothing depends on that name.
+	out = run('''
+	import fhs
+	def make():
+		def setup():
+			print('setup')
+		return setup
+	fhs.atinit(make())
+	fhs.atinit(make())
+	fhs.init(packagename = 'fhs-test')
+	''')
+	assert out.split() == ['setup', 'setup'], out
+	out = run('''
+	import fhs
+	def make():
+		def setup():
+			pass
+		return setup
+	fhs.atinit(make())
+	fhs.atinit(make())
+	fhs.atinit(lambda: None, name = 'user', depends = ['setup'])
+	try:
+		fhs.init(packagename = 'fhs-test')
+	except ValueError as err:
+		print(err)
+	''')
+	assert out.strip() == 'atinit hook user depends on setup, which is the name of more than one hook', out
+# }}}
+
+def test_parallel_lookups(): # {{{
+	# Tracing and counting must not mix up the lookups of parallel hooks.
+	out = run('''
+	import fhs, threading
+	def make(n):
+		def lookup():
+			for i in range(50):
+				fhs.read_data('missing-%d-%d' % (n, i))
+		return lookup
+	for n in range(4):
+		fhs.atinit(make(n), name = 'lookup-%d' % n, parallel = True)
+	fhs.init(packagename = 'fhs-test')
+	print(fhs._lookup.trace)
+	print(all(r['name'] in p[1] for r in fhs._trace_records for p in r['probes'] if 'missing-' in p[1]))
+	fhs.read_data('missing')
+	calls = fhs.lookup_syscalls()
+	thread = threading.Thread(target = lambda: fhs.read_data_many(['a', 'b']))
+	thread.start()
+	thread.join()
+	print(fhs.lookup_syscalls() == calls)
+	''', ['--fhs-trace'])
+	assert out.split('\n')[:3] == ['None', 'True', 'True'], out
+# }}}
+
+if __name__ == '__main__':
+	main(globals())
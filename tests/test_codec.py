@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+# Round trip and throughput tests for the config value codec.
+# vim: set fileencoding=utf-8 foldmethod=marker :
+
+import sys
+import time
+from helpers import SOURCE, run, main
+
+sys.path.insert(0, SOURCE)
+import fhs
+
+VALUES = ['', 'plain', 'a=b', 'a,b', 'back\\slash', 'tab\there', 'new\nline', '\\3d;', '%3d;', 'caf\xe9', '☺\U0001f600', ''.join(chr(c) for c in range(300))]
+
+def test_format(): # {{{
+	# This is the format on disk; changing it breaks existing files.
+	assert fhs._protect('a\\b=c,d\n\xe9', '=') == 'a\\5c;b\\3d;c,d\\a;\\e9;'
+	assert fhs._protect('a=b,c', ',') == 'a=b\\2c;c'
+	assert fhs._unprotect('a\\5c;b\\3d;c\\a;\\e9;') == 'a\\b=c\n\xe9'
+	# Percent escapes are not decoded.
+	assert fhs._unprotect('%3d;') == '%3d;'
+	# Raw characters outside the printable range are dropped.
+	assert fhs._unprotect('a\nb\xe9') == 'ab'
+# }}}
+
+def test_round_trip(): # {{{
+	for extra in ('', '=', ','):
+		for value in VALUES:
+			encoded = fhs._protect(value, extra)
+			assert all(0x20 <= ord(c) <= 0x7e for c in encoded), repr(encoded)
+			assert extra == '' or extra not in encoded, repr(encoded)
+			assert fhs._unprotect(encoded) == value, repr(value)
+# }}}
+
+def test_file_round_trip(): # {{{
+	out = run('''
+	import fhs
+	fhs.option('go', 'list', multiple = True)
+	fhs.option('text', 'string', default = '')
+	fhs.init(packagename = 'fhs-test')
+	values = {'go': %r, 'text': %r}
+	fhs.save_config(values)
+	loaded = fhs.load_config('commandline', {'go': [], 'text': ''}, options = fhs._options)
+	print(loaded == values)
+	''' % (VALUES, ''.join(VALUES)))
+	assert out.strip() == 'True', out
+# }}}
+
+def test_throughput(): # {{{
+	# Both directions must be linear in the size of the value.
+	times = {}
+	for size in (10, 1000, 100000, 1000000, 10000000):
+		value = ('The quick brown fox, a=b\\c caf\xe9\n' * (size // 32 + 1))[:size]
+		start = time.perf_counter()
+		encoded = fhs._protect(value, ',')
+		decoded = fhs._unprotect(encoded)
+		times[size] = time.perf_counter() - start
+		assert decoded == value
+		print('%9d bytes: %8.3f ms, %6.1f MB/s' % (size, times[size] * 1e3, size / times[size] / 1e6))
+	# Ten times more data may take at most 30 times longer; a quadratic
+	# implementation takes about 100 times longer.
+	assert times[10000000] < 30 * times[1000000], times
+# }}}
+
+if __name__ == '__main__':
+	main(globals())
@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+# Tests for options from environment variables and inherited configuration.
+# vim: set fileencoding=utf-8 foldmethod=marker :
+
+import os
+import tempfile
+from helpers import run, main
+
+PROGRAM = '''
+	import fhs, os, sys
+	fhs.option('num', 'a number', default = 1)
+	fhs.option('name', 'a name', default = 'none')
+	fhs.option('other', 'another number', default = 1)
+	fhs.module_info('plug-in', 'a module', '1.0', None)
+	fhs.module_option('plug-in', 'level', 'a level', default = 0)
+'''
+
+def test_environment(): # {{{
+	# The environment overrides the config file, but not the commandline.
+	with tempfile.TemporaryDirectory() as tmp:
+		os.makedirs(os.path.join(tmp, 'config', 'fhs-test'))
+		with open(os.path.join(tmp, 'config', 'fhs-test', 'commandline.ini'), 'w') as f:
+			f.write("num=2\nname='file'\nother=6\nplug-in-level=3\n")
+		out = run(PROGRAM + '''
+	os.environ['FHS_TEST_NUM'] = '4'
+	os.environ['FHS_TEST_NAME'] = 'environment'
+	os.environ['FHS_TEST_PLUG_IN_LEVEL'] = '5'
+	config = fhs.init(packagename = 'fhs-test', environment = True)
+	print(config['num'], config['name'], config['other'], fhs.module_get_config('plug-in')['level'])
+	''', ['--name=argv'], base = tmp)
+	assert out.strip() == '4 argv 6 5', out
+# }}}
+
+def test_inherit(): # {{{
+	# A spawned child uses the parent's configuration instead of its own
+	# commandline.
+	out = run(PROGRAM + '''
+	import subprocess
+	fhs.init(packagename = 'fhs-test')
+	fhs.publish()
+	child = """if True:
+		import fhs
+		fhs.option('num', 'a number', default = 1)
+		fhs.option('name', 'a name', default = 'none')
+		fhs.option('other', 'another number', default = 1)
+		fhs.module_info('plug-in', 'a module', '1.0', None)
+		fhs.module_option('plug-in', 'level', 'a level', default = 0)
+		config = fhs.init(packagename = 'fhs-test', inherit = True)
+		print(config['num'], config['name'], fhs.module_get_config('plug-in')['level'])
+	"""
+	sys.stdout.flush()
+	subprocess.run([sys.executable, '-c', child, '--num=100'], check = True)
+	''', ['--num=7', '--name=parent', '--plug-in-level=8'])
+	assert out.strip() == '7 parent 8', out
+# }}}
+
+if __name__ == '__main__':
+	main(globals())
@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+# Benchmark for the time that "import fhs" takes.
+# vim: set fileencoding=utf-8 foldmethod=marker :
+
+import os
+import sys
+import subprocess
+import tempfile
+from helpers import SOURCE, main
+
+## Maximum import time of fhs relative to the first commit of the tree, which
+# is measured in the same run.  fhs imports in less than half the time of the
+# baseline, because it defers most imports.  Override with the
+# FHS_IMPORT_RATIO environment variable.
+RATIO = float(os.getenv('FHS_IMPORT_RATIO', 0.75))
+## Number of runs of each version; the fastest one is used.
+RUNS = 7
+
+def baseline(target): # {{{
+	'''Write fhs.py from the first commit of the git repository to target.
+	@return True if it was written, False if this is not a git checkout.
+	'''
+	try:
+		root = subprocess.run(['git', 'rev-list', '--max-parents=0', 'HEAD'], cwd = SOURCE, capture_output = True, text = True, check = True).stdout.split()[-1]
+		data = subprocess.run(['git', 'show', root + ':fhs.py'], cwd = SOURCE, capture_output = True, check = True).stdout
+	except (OSError, IndexError, subprocess.CalledProcessError):
+		return False
+	with open(os.path.join(target, 'fhs.py'), 'wb') as f:
+		f.write(data)
+	return True
+# }}}
+
+def import_time(path): # {{{
+	'''Measure the cumulative import time of fhs in a new process.
+	@param path: Directory that contains the fhs.py to import.
+	@return The time in milliseconds.
+	'''
+	env = dict(os.environ, PYTHONPATH = path)
+	# Measure with cached bytecode, as an installed module would have.
+	env.pop('PYTHONDONTWRITEBYTECODE', None)
+	# Run in path, because the current directory comes first in sys.path.
+	proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import fhs'], env = env, cwd = path, capture_output = True, text = True, check = True)
+	for line in proc.stderr.split('\n'):
+		fields = line.split('|')
+		if len(fields) == 3 and fields[2].strip() == 'fhs':
+			return int(fields[1]) / 1000
+	raise AssertionError('no import time for fhs in output:\n' + proc.stderr)
+# }}}
+
+def test_import_time(): # {{{
+	# An absolute limit would depend on the machine, so compare with the
+	# baseline, alternating between the two to spread out any load.
+	with tempfile.TemporaryDirectory() as tmp:
+		if not baseline(tmp):
+			print('import fhs: skipped, no git history to compare with')
+			return
+		times = {SOURCE: [], tmp: []}
+		# The first run may have to compile fhs.py.
+		for path in times:
+			import_time(path)
+		for run in range(RUNS):
+			for path in times:
+				times[path].append(import_time(path))
+		best, reference = min(times[SOURCE]), min(times[tmp])
+	print('import fhs: %.2f ms, baseline %.2f ms (limit %.2f times)' % (best, reference, RATIO))
+	assert best <= RATIO * reference, 'import fhs took %.2f ms, %.2f times as long as the baseline; the limit is %.2f' % (best, best / reference, RATIO)
+# }}}
+
+def test_deferred_modules(): # {{{
+	# These modules are only imported when they are used.
+	code = 'import sys; before = set(sys.modules); import fhs; print(" ".join(sorted(m for m in ("argparse", "shutil", "tempfile", "hashlib", "json", "pickle") if m in sys.modules and m not in before)))'
+	env = dict(os.environ, PYTHONPATH = SOURCE)
+	out = subprocess.run([sys.executable, '-c', code], env = env, capture_output = True, text = True, check = True).stdout
+	assert out.strip() == '', 'imported by fhs: ' + out
+# }}}
+
+if __name__ == '__main__':
+	main(globals())
@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+# Tests for the configuration journal.
+# vim: set fileencoding=utf-8 foldmethod=marker :
+
+import os
+import tempfile
+from helpers import run, main
+
+PROGRAM = '''
+	import fhs
+	fhs.option('num', 'number', default = 28)
+	fhs.init(packagename = 'fhs-test')
+'''
+
+def test_update_then_load(): # {{{
+	out = run(PROGRAM + '''
+	fhs.update_config({'num': 2})
+	print(fhs.load_config('commandline'))
+	''')
+	assert out.strip() == "{'num': '2'}", out
+# }}}
+
+def test_save_replaces_journal(): # {{{
+	out = run(PROGRAM + '''
+	fhs.update_config({'num': 2})
+	fhs.save_config({'num': 3})
+	print(fhs.load_config('commandline'))
+	print(fhs.read_config('commandline.journal', opened = False))
+	''')
+	assert out.split('\n')[:2] == ["{'num': '3'}", 'None'], out
+# }}}
+
+def test_delayed_save_replaces_journal(): # {{{
+	out = run(PROGRAM + '''
+	fhs.update_config({'num': 42})
+	fhs.save_config({'num': 51}, delay = 10)
+	fhs.flush_config()
+	print(fhs.load_config('commandline'))
+	''')
+	assert out.strip() == "{'num': '51'}", out
+# }}}
+
+def test_compact(): # {{{
+	out = run(PROGRAM + '''
+	fhs.save_config({'num': 3})
+	fhs.update_config({'num': 4})
+	fhs.update_config({'num': 5})
+	fhs.compact_config()
+	print(fhs.read_config('commandline.journal', opened = False))
+	print(fhs.read_config('commandline.ini').read().strip())
+	''')
+	assert out.split('\n')[:2] == ['None', 'num=5'], out
+# }}}
+
+def test_compact_system_file(): # {{{
+	# The new user file hides the system file, so it must keep its values.
+	with tempfile.TemporaryDirectory() as tmp:
+		os.makedirs(os.path.join(tmp, 'etc', 'fhs-test'))
+		with open(os.path.join(tmp, 'etc', 'fhs-test', 'commandline.ini'), 'w') as f:
+			f.write('a=sys\nb=sysb\n')
+		out = run('''
+		import fhs
+		fhs.option('a', 'a', default = 'da')
+		fhs.option('b', 'b', default = 'db')
+		fhs.init(packagename = 'fhs-test')
+		fhs.update_config({'a': 'user'})
+		print(sorted(fhs.load_config('commandline').items()))
+		fhs.compact_config()
+		print(sorted(fhs.load_config('commandline').items()))
+		''', base = tmp)
+	assert out.split('\n')[:2] == ["[('a', \"'user'\"), ('b', 'sysb')]"] * 2, out
+# }}}
+
+def test_concurrent_updates(): # {{{
+	# Several processes append while the journal is compacted all the
+	# time; no record may be lost.
+	out = run(PROGRAM + '''
+	import os
+	children = []
+	for child in range(4):
+		pid = os.fork()
+		if pid == 0:
+			for i in range(200):
+				fhs.update_config({'key-%d-%d' % (child, i): i}, threshold = 256)
+			os._exit(0)
+		children.append(pid)
+	for pid in children:
+		os.waitpid(pid, 0)
+	fhs.compact_config()
+	print(len(fhs.load_config('commandline')))
+	''')
+	assert out.strip() == '800', out
+# }}}
+
+if __name__ == '__main__':
+	main(globals())
@@ -0,0 +1,37 @@
+#!/usr/bin/python3
+# Tests for finding files.
+# vim: set fileencoding=utf-8 foldmethod=marker :
+
+from helpers import run, main
+
+def test_indexed_removed_file(): # {{{
+	out = run('''
+	import fhs, os
+	fhs.init(packagename = 'fhs-test', indexed = True)
+	with fhs.write_data('test.txt') as f:
+		f.write('data')
+	path = fhs.read_data('test.txt', opened = False)
+	print(fhs.read_data('test.txt').read())
+	os.unlink(path)
+	print(fhs.read_data('test.txt'))
+	''')
+	assert out.split('\n')[:2] == ['data', 'None'], out
+# }}}
+
+def test_write_name_then_create(): # {{{
+	# The caller creates the directory of a name from write_data().
+	out = run('''
+	import fhs, os
+	fhs.init(packagename = 'fhs-test')
+	print(fhs.read_data('foo.txt'))
+	path = fhs.write_data('foo.txt', opened = False)
+	os.makedirs(os.path.dirname(path))
+	with open(path, 'w') as f:
+		f.write('data')
+	print(fhs.read_data('foo.txt').read())
+	''')
+	assert out.split('\n')[:2] == ['None', 'data'], out
+# }}}
+
+if __name__ == '__main__':
+	main(globals())
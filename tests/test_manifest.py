@@ -0,0 +1,37 @@
+#!/usr/bin/python3
+# Tests for the resolution manifest.
+# vim: set fileencoding=utf-8 foldmethod=marker :
+
+import os
+import sys
+import subprocess
+import tempfile
+from helpers import environment, main
+
+def test_freeze_commandline(): # {{{
+	with tempfile.TemporaryDirectory() as tmp:
+		env = environment(tmp)
+		program = os.path.join(tmp, 'bin', 'fhs-test')
+		os.makedirs(os.path.dirname(program))
+		with open(program, 'w') as f:
+			f.write('import fhs\nfhs.init(packagename = "fhs-test")\nprint(fhs.load_manifest())\n')
+		# Without --base, the manifest would never match the program.
+		proc = subprocess.run([sys.executable, '-m', 'fhs', '--packagename=fhs-test', 'freeze'], env = env, cwd = tmp, capture_output = True, text = True)
+		assert proc.returncode == 1 and 'usage' in proc.stderr, proc
+		proc = subprocess.run([sys.executable, '-m', 'fhs', '--packagename=fhs-test', '--base=' + os.path.dirname(program), 'freeze'], env = env, cwd = tmp, capture_output = True, text = True)
+		assert proc.returncode == 0, proc.stderr
+		out = subprocess.run([sys.executable, program], env = env, cwd = tmp, capture_output = True, text = True).stdout
+		assert out.strip() == 'True', out
+# }}}
+
+def test_freeze_without_runtime_dir(): # {{{
+	# The temporary runtime directory is removed at exit.
+	with tempfile.TemporaryDirectory() as tmp:
+		env = environment(tmp)
+		del env['XDG_RUNTIME_DIR']
+		proc = subprocess.run([sys.executable, '-m', 'fhs', '--packagename=fhs-test', '--base=' + tmp, 'freeze'], env = env, cwd = tmp, capture_output = True, text = True)
+		assert proc.returncode == 1 and 'XDG_RUNTIME_DIR' in proc.stderr, proc
+# }}}
+
+if __name__ == '__main__':
+	main(globals())
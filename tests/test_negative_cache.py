@@ -0,0 +1,58 @@
+#!/usr/bin/python3
+# Tests for the cache of failed lookups.
+# vim: set fileencoding=utf-8 foldmethod=marker :
+
+from helpers import run, main
+
+PROGRAM = '''
+	import fhs, os, time
+	fhs.init(packagename = 'fhs-test')
+'''
+
+def test_write_then_read(): # {{{
+	# A write through fhs must be visible immediately, even though the
+	# miss before it is cached.
+	out = run(PROGRAM + '''
+	fhs.negative_cache(60)
+	for read, write in ((fhs.read_data, fhs.write_data), (fhs.read_cache, fhs.write_cache)):
+		print(read('file.txt'))
+		with write('file.txt') as f:
+			f.write('data')
+		print(read('file.txt').read())
+	''')
+	assert out.split('\n')[:4] == ['None', 'data'] * 2, out
+# }}}
+
+def test_ttl(): # {{{
+	# Files that are created behind fhs's back are found once the miss
+	# has expired.
+	out = run(PROGRAM + '''
+	fhs.negative_cache(0.5)
+	fhs.write_data('other.txt').close()
+	print(fhs.read_data('file.txt'))
+	with open(os.path.join(os.path.dirname(fhs.read_data('other.txt', opened = False)), 'file.txt'), 'w') as f:
+		f.write('data')
+	print(fhs.read_data('file.txt'), fhs.lookup_syscalls())
+	time.sleep(0.6)
+	print(fhs.read_data('file.txt').read())
+	''')
+	assert out.split('\n')[:3] == ['None', 'None 0', 'data'], out
+# }}}
+
+def test_lru(): # {{{
+	# The least recently used miss is dropped when the cache is full.
+	out = run(PROGRAM + '''
+	fhs.negative_cache(60, size = 2)
+	def cost(name):
+		fhs.read_data(name)
+		return fhs.lookup_syscalls()
+	for name in ('a', 'b', 'c'):
+		cost(name)
+	# The cache holds b and c; using b makes c the oldest, so d replaces it.
+	print(cost('b'), cost('d') > 0, cost('b'), cost('c') > 0)
+	''')
+	assert out.strip() == '0 True 0 True', out
+# }}}
+
+if __name__ == '__main__':
+	main(globals())
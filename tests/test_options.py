@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+# Tests and benchmark for registering options.
+# vim: set fileencoding=utf-8 foldmethod=marker :
+
+from helpers import run, main
+
+REGISTER = '''
+	import fhs, string, time
+	fhs.module_info('plugin', 'a plugin', '1.0', None)
+	shorts = [c for c in string.ascii_letters + string.digits if c not in 'hv']
+	count = %d
+	start = time.perf_counter()
+	for i in range(count):
+		# The options with short names come last, when the registry is full.
+		index = i - count + len(shorts)
+		fhs.module_option('plugin', 'option-%%d' %% i, 'help', short = shorts[index] if index >= 0 else None, default = i)
+	print(time.perf_counter() - start)
+'''
+
+def test_duplicate_short(): # {{{
+	out = run('''
+	import fhs
+	fhs.option('one', 'first', short = 'o')
+	try:
+		fhs.option('two', 'second', short = 'o')
+	except ValueError as err:
+		print(err)
+	fhs.option('help-me', 'uses h', short = 'h')
+	fhs.init(packagename = 'fhs-test')
+	''', ['-h'])
+	assert out.strip() == 'duplicate short option o defined', out
+# }}}
+
+def test_spec_mapping(): # {{{
+	# Code that used the old dict specifications must keep working.
+	out = run('''
+	import fhs
+	fhs.option('num', 'a number', short = 'n', default = 3)
+	spec = fhs._options['num']
+	assert dict(spec)['default'] == 3 and dict(spec)['argtype'] is int
+	assert 'short' in spec and 'bogus' not in spec
+	assert spec.get('short') == 'n' and spec.get('bogus', 5) == 5
+	assert sorted(spec) == sorted(spec.keys()) and len(spec) == len(spec.keys())
+	assert dict(spec.items()) == dict(zip(spec.keys(), spec.values()))
+	print('ok')
+	''')
+	assert out.strip() == 'ok', out
+# }}}
+
+def test_registration_linear(): # {{{
+	# Registering must be linear in the number of options.
+	times = {}
+	for count in (2000, 20000):
+		times[count] = min(float(run(REGISTER % count)) for attempt in range(3))
+		print('%6d options: %7.1f ms' % (count, times[count] * 1e3))
+	assert times[20000] < 30 * times[2000], times
+# }}}
+
+if __name__ == '__main__':
+	main(globals())
@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+# Tests and benchmark for parsing the commandline.
+# vim: set fileencoding=utf-8 foldmethod=marker :
+
+import io
+import os
+import sys
+import time
+import tempfile
+import contextlib
+from helpers import SOURCE, main
+
+sys.path.insert(0, SOURCE)
+import fhs
+
+def options(): # {{{
+	ret = {}
+	fhs.option('flag', 'a flag', short = 'f', argtype = bool, options = ret, option_order = [])
+	fhs.option('num', 'a number', short = 'n', default = 0, options = ret, option_order = [])
+	fhs.option('go', 'a list', short = 'g', multiple = True, options = ret, option_order = [])
+	return ret
+# }}}
+
+def test_inplace(): # {{{
+	argv = ['prog', '-f', 'a', '--num=3', '-g', 'x', '--go', 'y', 'b', '--', '-f']
+	values, present = fhs.parse_args(argv, options(), extra = True)
+	assert values == {'flag': True, 'num': 3, 'go': ['x', 'y']}, values
+	assert present == {'flag': True, 'num': True, 'go': True}, present
+	assert argv == ['prog', 'a', 'b', '-f'], argv
+# }}}
+
+def test_not_inplace(): # {{{
+	argv = ['prog', '-fn3', 'a', '-gx', 'b']
+	values, remaining = fhs.parse_args(argv, options(), inplace = False)
+	assert values == {'flag': True, 'num': 3, 'go': ['x']}, values
+	assert remaining == ['prog', 'a', 'b'], remaining
+	assert argv == ['prog', '-fn3', 'a', '-gx', 'b'], argv
+# }}}
+
+def response_files(tmp, files): # {{{
+	'''Write response files into tmp; files maps names to lists of lines.'''
+	for name in files:
+		with open(os.path.join(tmp, name), 'w') as f:
+			f.write(''.join(line + '\n' for line in files[name]))
+	return os.path.join(tmp, '')
+# }}}
+
+def test_response_nested(): # {{{
+	with tempfile.TemporaryDirectory() as tmp:
+		d = response_files(tmp, {'outer': ['-g', 'one', '', '@' + os.path.join(tmp, 'inner'), '--go=three', 'a'], 'inner': ['--num=5', '-gtwo']})
+		argv = ['prog', '@' + d + 'outer', '-g', 'four', 'b']
+		values, remaining = fhs.parse_args(argv, options(), inplace = False, response_files = True)
+	assert values == {'flag': False, 'num': 5, 'go': ['one', 'two', 'three', 'four']}, values
+	assert remaining == ['prog', 'a', 'b'], remaining
+# }}}
+
+def test_response_separator(): # {{{
+	# A -- in a response file ends the options, also on the commandline.
+	with tempfile.TemporaryDirectory() as tmp:
+		d = response_files(tmp, {'args': ['-f', '--', '-n', '3']})
+		values, remaining = fhs.parse_args(['prog', '@' + d + 'args', '-g', 'x'], options(), inplace = False, response_files = True)
+	assert values == {'flag': True, 'num': 0, 'go': []}, values
+	assert remaining == ['prog', '-n', '3', '-g', 'x'], remaining
+# }}}
+
+def test_response_unreadable(): # {{{
+	# The argument is kept as a positional argument, with a warning.
+	err = io.StringIO()
+	with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stderr(err):
+		missing = '@' + os.path.join(tmp, 'missing')
+		values, remaining = fhs.parse_args(['prog', missing, '-f'], options(), inplace = False, response_files = True)
+	assert values['flag'] is True, values
+	assert remaining == ['prog', missing], remaining
+	assert err.getvalue().startswith('Warning: unable to read response file ' + missing[1:]), err.getvalue()
+	# Without response_files, @ arguments are not special.
+	values, remaining = fhs.parse_args(['prog', missing], options(), inplace = False)
+	assert remaining == ['prog', missing], remaining
+# }}}
+
+def test_linear(): # {{{
+	# Parsing must be linear in the number of arguments, up to a million.
+	times = {}
+	for size in (10000, 100000, 1000000):
+		argv = ['prog'] + ['-g', 'value', 'positional'] * (size // 3)
+		start = time.perf_counter()
+		values, remaining = fhs.parse_args(argv, options(), inplace = False)
+		times[size] = time.perf_counter() - start
+		assert len(values['go']) == size // 3 and len(remaining) == size // 3 + 1
+		print('%8d arguments: %8.1f ms' % (size, times[size] * 1e3))
+	# Ten times more arguments may take at most 30 times longer; the old
+	# quadratic parser took about 100 times longer.
+	assert times[1000000] < 30 * times[100000], times
+# }}}
+
+if __name__ == '__main__':
+	main(globals())
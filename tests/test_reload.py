@@ -0,0 +1,34 @@
+#!/usr/bin/python3
+# Tests for reloading the configuration.
+# vim: set fileencoding=utf-8 foldmethod=marker :
+
+from helpers import run, main
+
+def test_watcher_is_not_counted(): # {{{
+	# Lookups by the watcher thread must not show up in lookup_syscalls()
+	# or in the trace of the program.
+	out = run('''
+	import fhs, threading
+	fhs.option('num', 'number', default = 28)
+	fhs.init(packagename = 'fhs-test')
+	fhs.save_config({'num': 1})
+	fhs.reload_config()
+	fhs.trace()
+	changed = threading.Event()
+	fhs.on_config_change('num', lambda change: changed.set())
+	path = fhs.read_config('commandline.ini', opened = False)
+	fhs.watch_config(.05)
+	fhs.read_data('missing.txt')
+	calls = fhs.lookup_syscalls()
+	records = len(fhs._trace_records)
+	with open(path, 'w') as f:
+		f.write('num=55\\n')
+	print(changed.wait(10))
+	fhs.unwatch_config()
+	print(fhs.get_config()['num'], fhs.lookup_syscalls() == calls, len(fhs._trace_records) == records)
+	''')
+	assert out.split('\n')[:2] == ['True', '55 True True'], out
+# }}}
+
+if __name__ == '__main__':
+	main(globals())
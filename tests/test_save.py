@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+# Tests for saving configuration files.
+# vim: set fileencoding=utf-8 foldmethod=marker :
+
+from helpers import run, main
+
+PROGRAM = '''
+	import fhs, os, stat
+	fhs.option('num', 'number', default = 28)
+	fhs.init(packagename = 'fhs-test')
+	def mode():
+		return oct(stat.S_IMODE(os.stat(fhs.read_config('commandline.ini', opened = False)).st_mode))
+'''
+
+def test_atomic_keeps_mode(): # {{{
+	out = run(PROGRAM + '''
+	fhs.save_config({'num': 1})
+	os.chmod(fhs.read_config('commandline.ini', opened = False), 0o640)
+	fhs.save_config({'num': 2}, atomic = True)
+	print(mode())
+	''')
+	assert out.strip() == '0o640', out
+# }}}
+
+def test_atomic_symlink(): # {{{
+	# The file behind a symbolic link is replaced, not the link.
+	out = run(PROGRAM + '''
+	path = fhs.write_config('commandline.ini', opened = False)
+	real = os.path.join(os.path.dirname(path), 'dot', 'real.ini')
+	os.makedirs(os.path.dirname(real))
+	with open(real, 'w') as f:
+		f.write('num=1\\n')
+	os.symlink(os.path.join('dot', 'real.ini'), path)
+	fhs.save_config({'num': 2}, atomic = True)
+	print(os.path.islink(path), open(real).read().strip())
+	fhs.update_config({'num': 3})
+	fhs.compact_config()
+	print(os.path.islink(path), open(real).read().strip())
+	''')
+	assert out.split('\n')[:2] == ['True num=2', 'True num=3'], out
+# }}}
+
+def test_atomic_new_file_uses_umask(): # {{{
+	out = run(PROGRAM + '''
+	os.umask(0o022)
+	fhs.save_config({'num': 2}, atomic = True)
+	print(mode())
+	''')
+	assert out.strip() == '0o644', out
+# }}}
+
+def test_delay_restarts(): # {{{
+	out = run(PROGRAM + '''
+	import time
+	fhs.save_config({'num': 1}, delay = .5)
+	time.sleep(.3)
+	fhs.save_config({'num': 2}, delay = .5)
+	time.sleep(.3)
+	# The first delay has passed, but the second call restarted it.
+	print(fhs.read_config('commandline.ini', opened = False))
+	time.sleep(.5)
+	print(fhs.read_config('commandline.ini').read().strip())
+	''')
+	assert out.split('\n')[:2] == ['None', 'num=2'], out
+# }}}
+
+if __name__ == '__main__':
+	main(globals())
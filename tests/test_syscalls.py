@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+# Tests for the number of filesystem calls that lookups make.
+# vim: set fileencoding=utf-8 foldmethod=marker :
+
+from helpers import run, main
+
+def test_lookup_costs(): # {{{
+	# These are upper bounds; a change that makes lookups more expensive
+	# must fail here.
+	out = run('''
+	import fhs
+	fhs.init(packagename = 'fhs-test')
+	with fhs.write_data('found.txt') as f:
+		f.write('data')
+	search = len(fhs._data_dirs(True, None))
+	# Cold: every search directory once, one probe and one stamp.
+	assert fhs.read_data('found.txt', opened = False) is not None
+	print('cold', fhs.lookup_syscalls(), search + 2)
+	# Cached: only the stamp of the directory is checked.
+	assert fhs.read_data('found.txt', opened = False) is not None
+	print('cached', fhs.lookup_syscalls(), 1)
+	fhs.read_data('found.txt').close()
+	print('opened', fhs.lookup_syscalls(), 2)
+	# Miss: one probe per existing search directory.
+	existing = len(fhs._search_path('data', fhs._data_dirs, True, None))
+	assert fhs.read_data('missing.txt') is None
+	print('miss', fhs.lookup_syscalls(), existing)
+	fhs.negative_cache(60)
+	fhs.read_data('missing.txt')
+	fhs.read_data('missing.txt')
+	print('cached-miss', fhs.lookup_syscalls(), 0)
+	''')
+	for line in out.splitlines():
+		what, calls, limit = line.split()
+		assert int(calls) <= int(limit), '%s lookup made %s calls; at most %s expected' % (what, calls, limit)
+	assert len(out.splitlines()) == 5, out
+# }}}
+
+def test_config_costs(): # {{{
+	out = run('''
+	import fhs
+	fhs.init(packagename = 'fhs-test')
+	fhs.save_config({'num': 1})
+	fhs.read_config('commandline.ini', opened = False)
+	fhs.read_config('commandline.ini', opened = False)
+	print(fhs.lookup_syscalls())
+	fhs.read_config_many(['commandline.ini', 'missing.ini'], opened = False)
+	print(fhs.lookup_syscalls(), 2 * len(fhs._search_path('config', fhs._config_dirs, True, None)))
+	''')
+	cached, many, limit = out.split()
+	assert int(cached) <= 1, out
+	assert int(many) <= int(limit), out
+# }}}
+
+if __name__ == '__main__':
+	main(globals())